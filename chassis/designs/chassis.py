@@ -2,6 +2,8 @@ import cairo
 import pint
 import math
 from collections import namedtuple
+from .kerf import compensate
+from .recording import RecordingContext, replay
 
 units = pint.UnitRegistry()
 LineStyle = namedtuple("LineStyle", "width color dash")
@@ -102,7 +104,9 @@ MOTOR_MOUNTING_EDGE_CLEARANCE = 2.0 * units.mm
 
 MARKER_WIDTH = 8.7 * units.mm
 SERVO_MOUNT_HOLE_CLEARANCE = 1.0 * units.mm
-SERVO_MOUNT_BREADTH = 22.5 * units.mm + 2 * (2 * SERVO_MOUNT_HOLE_CLEARANCE + M3_MOUNTING_HOLE.nut_width)
+def servo_mount_breadth(hole):
+    return 22.5 * units.mm + 2 * (2 * SERVO_MOUNT_HOLE_CLEARANCE + hole.nut_width)
+SERVO_MOUNT_BREADTH = servo_mount_breadth(M3_MOUNTING_HOLE)
 SERVO_MOUNT_CENTER_OFFSET = 14.5 * units.mm + 0.5 * MARKER_WIDTH
 SERVO_MOUNTING_SHELF_WIDTH = 4.7 * units.mm
 SERVO_MOUNTING_SHELF_HEIGHT = 11.8 * units.mm
@@ -126,6 +130,11 @@ else:
     MAJOR_GRID = True
     MINOR_GRID = True
 
+# offset cut contours by half the kerf: outward for outer boundaries, inward
+# for holes and slots (leave off if the dimensions are already compensated)
+KERF_COMPENSATION = False
+LASER_KERF = 0.2 * units.mm
+
 TESSELATION = False
 TESSELATION_CANVAS_WIDTH = 14 * units.inch
 TESSELATION_CANVAS_HEIGHT = 11 * units.inch
@@ -767,6 +776,16 @@ def render(context):
 
     context.restore()
 
+def render_sheet(context, count_h, count_v):
+    for y in range(count_v):
+        for x in range(count_h):
+            context.identity_matrix()
+            context.translate(
+                (x * TESSELATION_OFFSET_X).to(units.points).magnitude,
+                (y * TESSELATION_OFFSET_Y).to(units.points).magnitude
+            )
+            render(context)
+
 if __name__ == '__main__':
     if TESSELATION:
         w = TESSELATION_CANVAS_WIDTH.to(units.points).magnitude
@@ -780,11 +799,9 @@ if __name__ == '__main__':
         count_v = 1
     with cairo.SVGSurface("chassis.svg", w, h) as surface:
         context = cairo.Context(surface)
-        for y in range(count_v):
-            for x in range(count_h):
-                context.identity_matrix()
-                context.translate(
-                    (x * TESSELATION_OFFSET_X).to(units.points).magnitude,
-                    (y * TESSELATION_OFFSET_Y).to(units.points).magnitude
-                )
-                render(context)
+        if KERF_COMPENSATION:
+            recording = RecordingContext()
+            render_sheet(recording, count_h, count_v)
+            replay(compensate(recording.strokes, PTS(LASER_KERF), CUT_LINE_STYLE.color), context)
+        else:
+            render_sheet(context, count_h, count_v)
@@ -0,0 +1,664 @@
+"""
+Compile SVG artwork into a drawPicture() body for the workshop sketches.
+
+The paths of the SVG (as emitted by cairo, like chassis.svg) are flattened
+into polylines, ordered to keep pen up travel short and then driven with the
+sketch API. The robot can only drive forward and pivot around one of its
+wheels, which also moves the pen, so every move is planned on the simulator's
+model of the robot and the next move starts from where the quantized (whole
+millisecond) commands actually left it:
+
+  * pen up, each stroke is approached with a pivot, a straight drive and a
+    second pivot that leaves the pen on the stroke's first point, facing
+    along it;
+  * pen down, the robot pivots to aim the pen at the next point and drives
+    there. A pivot swings the pen around a wheel, so only turns that keep
+    the pen within the tolerance of the corner (see sharp_corner()) are
+    drawn this way, sharper corners are approached again with the pen up.
+
+    python -m designs.compiler picture.svg > picture.ino.txt
+"""
+from __future__ import print_function
+
+import argparse
+import math
+import re
+import sys
+import warnings
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+from .chassis import units
+from .sketch import Command
+from .simulator import DEFAULT_ROBOT, drawing_time, render_preview, simulate
+
+# maximum distance (mm) between a curve and its flattened polyline
+DEFAULT_TOLERANCE = 0.5
+# curves are not split further once they turn less than this many
+# milliseconds worth of turnLeft/turnRight, the robot cannot follow it
+MIN_TURN_STEPS = 4
+MAX_SUBDIVISION_DEPTH = 16
+# points closer than this (mm) are merged
+MIN_SEGMENT_LENGTH = 0.2
+
+DRAW_SPEED_PCT = 25
+TRAVEL_SPEED_PCT = 50
+# time for the marker servo to settle after penUp/penDown
+PEN_SETTLE_MS = 250
+# guard for the 2-opt refinement of the stroke order, every move shortens
+# the pen up travel so it ends on its own long before on sane drawings
+MAX_2OPT_MOVES = 100000
+# distance (mm) between the robot's start position and the drawing
+START_CLEARANCE = 20.0
+
+AIM_SAMPLES = 720
+BISECTION_STEPS = 40
+MAX_AIM_RETRIES = 4
+
+SVG_NAMESPACE = "{http://www.w3.org/2000/svg}"
+# points per svg length unit ("pt" means pint to pint, so no units.Quantity)
+SVG_UNITS = {"": 0.75, "px": 0.75, "pt": 1.0, "pc": 12.0, "in": 72.0, "mm": 72.0 / 25.4, "cm": 720.0 / 25.4}
+SKIPPED_ELEMENTS = frozenset(("defs", "symbol", "clipPath", "mask", "pattern", "marker"))
+
+class CompileError(Exception):
+    pass
+
+# svg parsing
+
+def _parse_transform(text):
+    # affine matrix (a, b, c, d, e, f) as in svg: x' = a x + c y + e
+    matrix = np.identity(3)
+    for name, args in re.findall(r"(\w+)\s*\(([^)]*)\)", text or ""):
+        values = [float(v) for v in re.findall(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?", args)]
+        if name == "matrix":
+            a, b, c, d, e, f = values
+        elif name == "translate":
+            a, b, c, d, e, f = 1.0, 0.0, 0.0, 1.0, values[0], values[1] if len(values) > 1 else 0.0
+        elif name == "scale":
+            a, b, c, d, e, f = values[0], 0.0, 0.0, values[-1], 0.0, 0.0
+        elif name == "rotate":
+            angle = math.radians(values[0])
+            cx, cy = (values[1], values[2]) if len(values) > 2 else (0.0, 0.0)
+            cos, sin = math.cos(angle), math.sin(angle)
+            a, b, c, d = cos, sin, -sin, cos
+            e, f = cx - cos * cx + sin * cy, cy - sin * cx - cos * cy
+        else:
+            raise CompileError("unsupported transform %s()" % name)
+        matrix = matrix.dot(np.array(((a, c, e), (b, d, f), (0.0, 0.0, 1.0))))
+    return matrix
+
+_PATH_TOKEN = re.compile(r"[MmLlHhVvCcSsQqTtZzAa]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+def parse_path(data):
+    """
+    Parse svg path data into sub paths, lists of ("L", p) and ("C", c1, c2, p)
+    segments following a start point: [(start, [segments], closed), ...].
+    """
+    tokens = _PATH_TOKEN.findall(data)
+    subpaths = []
+    command = None
+    current = start = (0.0, 0.0)
+    # last control point of a C/S (kind "C") or Q/T (kind "Q") segment, S
+    # and T only reflect the control point of their own family
+    previous_control = None
+    previous_kind = None
+    segments = None
+
+    # a list so take() can advance it (no nonlocal on python 2)
+    index = [0]
+
+    def take(count):
+        values = []
+        for _ in range(count):
+            if index[0] >= len(tokens) or tokens[index[0]].isalpha():
+                raise CompileError("malformed path data")
+            values.append(float(tokens[index[0]]))
+            index[0] += 1
+        return values
+
+    while index[0] < len(tokens):
+        token = tokens[index[0]]
+        if token.isalpha():
+            command = token
+            index[0] += 1
+        elif command is None:
+            raise CompileError("path data must start with a command")
+        relative = command.islower()
+        base = current if relative else (0.0, 0.0)
+        kind = command.upper()
+        if kind == "M":
+            x, y = take(2)
+            current = start = (base[0] + x, base[1] + y)
+            segments = []
+            subpaths.append((start, segments, False))
+            # further coordinate pairs are implicit line_to
+            command = "l" if relative else "L"
+            previous_control = previous_kind = None
+            continue
+        if segments is None:
+            raise CompileError("path data must start with a move")
+        if kind == "Z":
+            if subpaths and subpaths[-1][1] is segments:
+                subpaths[-1] = (subpaths[-1][0], segments, True)
+            if current != start:
+                segments.append(("L", start))
+            current = start
+            segments = []
+            subpaths.append((start, segments, False))
+            previous_control = previous_kind = None
+            command = None
+            continue
+        if kind in ("L", "H", "V"):
+            if kind == "L":
+                x, y = take(2)
+                point = (base[0] + x, base[1] + y)
+            elif kind == "H":
+                (x,) = take(1)
+                point = ((current[0] if relative else 0.0) + x, current[1])
+            else:
+                (y,) = take(1)
+                point = (current[0], (current[1] if relative else 0.0) + y)
+            segments.append(("L", point))
+            current = point
+            previous_control = previous_kind = None
+        elif kind in ("C", "S"):
+            if kind == "C":
+                x1, y1, x2, y2, x, y = take(6)
+                c1 = (base[0] + x1, base[1] + y1)
+            else:
+                x2, y2, x, y = take(4)
+                c1 = current if previous_kind != "C" else \
+                    (2 * current[0] - previous_control[0], 2 * current[1] - previous_control[1])
+            c2 = (base[0] + x2, base[1] + y2)
+            point = (base[0] + x, base[1] + y)
+            segments.append(("C", c1, c2, point))
+            previous_control, previous_kind = c2, "C"
+            current = point
+        elif kind in ("Q", "T"):
+            if kind == "Q":
+                x1, y1, x, y = take(4)
+                control = (base[0] + x1, base[1] + y1)
+            else:
+                x, y = take(2)
+                control = current if previous_kind != "Q" else \
+                    (2 * current[0] - previous_control[0], 2 * current[1] - previous_control[1])
+            point = (base[0] + x, base[1] + y)
+            # elevate to a cubic
+            c1 = (current[0] + 2.0 / 3.0 * (control[0] - current[0]), current[1] + 2.0 / 3.0 * (control[1] - current[1]))
+            c2 = (point[0] + 2.0 / 3.0 * (control[0] - point[0]), point[1] + 2.0 / 3.0 * (control[1] - point[1]))
+            segments.append(("C", c1, c2, point))
+            previous_control, previous_kind = control, "Q"
+            current = point
+        else:
+            raise CompileError("unsupported path command %s" % command)
+    return [subpath for subpath in subpaths if subpath[1]]
+
+def _stroke_color(element):
+    style = dict(
+        (key.strip(), value.strip())
+        for key, value in (item.split(":", 1) for item in (element.get("style") or "").split(";") if ":" in item)
+    )
+    return style.get("stroke", element.get("stroke"))
+
+def read_svg(path, stroke=None):
+    """
+    The paths of an svg file as (transform, sub paths) pairs, transforms map
+    svg user units to points. With `stroke` only paths stroked in that color
+    (as written in the file, e.g. "rgb(100%,0%,0%)") are read.
+    """
+    root = ElementTree.parse(path).getroot()
+    matrix = np.identity(3)
+    view_box = root.get("viewBox")
+    width = root.get("width")
+    if view_box and width:
+        # scale the view box to the document width (cairo writes points)
+        box = [float(v) for v in view_box.replace(",", " ").split()]
+        size = re.match(r"([-+]?[\d.]+)\s*(\w*)", width)
+        if size.group(2) not in SVG_UNITS:
+            raise CompileError("unsupported document width %s" % width)
+        document_width = float(size.group(1)) * SVG_UNITS[size.group(2)]
+        matrix = np.array(((document_width / box[2], 0.0, -box[0] * document_width / box[2]),
+            (0.0, document_width / box[2], -box[1] * document_width / box[2]),
+            (0.0, 0.0, 1.0)))
+    paths = []
+
+    def walk(element, transform):
+        tag = element.tag.replace(SVG_NAMESPACE, "")
+        if tag in SKIPPED_ELEMENTS:
+            return
+        transform = transform.dot(_parse_transform(element.get("transform")))
+        if tag == "path" and (stroke is None or _stroke_color(element) == stroke):
+            paths.append((transform, parse_path(element.get("d", ""))))
+        for child in element:
+            walk(child, transform)
+
+    walk(root, matrix)
+    return paths
+
+# flattening
+
+def min_turn(robot=DEFAULT_ROBOT):
+    """
+    Smallest heading change (radians) worth flattening curves for: the robot
+    turns in whole milliseconds of turnLeft/turnRight.
+    """
+    turn_rate = robot.turn_speed * robot.wheel_speed / 255.0 / robot.wheelbase
+    return MIN_TURN_STEPS * 0.001 * turn_rate
+
+def _cross(a, b):
+    return a[0] * b[1] - a[1] * b[0]
+
+def _flatness(p0, p1, p2, p3):
+    chord = p3 - p0
+    length = math.hypot(chord[0], chord[1])
+    if length < 1e-12:
+        return max(math.hypot(*(p1 - p0)), math.hypot(*(p2 - p0)))
+    return max(abs(_cross(chord, p1 - p0)), abs(_cross(chord, p2 - p0))) / length
+
+def _turn(p0, p1, p2, p3):
+    start = p1 - p0 if math.hypot(*(p1 - p0)) > 1e-12 else p2 - p0
+    end = p3 - p2 if math.hypot(*(p3 - p2)) > 1e-12 else p3 - p1
+    return abs(math.atan2(_cross(start, end), np.dot(start, end)))
+
+def _flatten_cubic(p0, p1, p2, p3, tolerance, turn, points, depth=0):
+    if depth >= MAX_SUBDIVISION_DEPTH or _flatness(p0, p1, p2, p3) <= tolerance or _turn(p0, p1, p2, p3) <= turn:
+        points.append(p3)
+        return
+    p01, p12, p23 = 0.5 * (p0 + p1), 0.5 * (p1 + p2), 0.5 * (p2 + p3)
+    p012, p123 = 0.5 * (p01 + p12), 0.5 * (p12 + p23)
+    middle = 0.5 * (p012 + p123)
+    _flatten_cubic(p0, p01, p012, middle, tolerance, turn, points, depth + 1)
+    _flatten_cubic(middle, p123, p23, p3, tolerance, turn, points, depth + 1)
+
+def flatten(paths, scale, tolerance=DEFAULT_TOLERANCE, robot=DEFAULT_ROBOT):
+    """
+    Polylines (arrays of points in mm) of the paths read by read_svg(), with
+    `scale` mm per point.
+    """
+    turn = min_turn(robot)
+    polylines = []
+    for (transform, subpaths) in paths:
+        matrix = np.diag((scale, scale, 1.0)).dot(transform)
+        def apply(point):
+            return matrix[:2, :2].dot(point) + matrix[:2, 2]
+        for (start, segments, closed) in subpaths:
+            current = apply(np.array(start, dtype=float))
+            points = [current]
+            for segment in segments:
+                if segment[0] == "L":
+                    current = apply(np.array(segment[1], dtype=float))
+                    points.append(current)
+                else:
+                    c1, c2, end = (apply(np.array(p, dtype=float)) for p in segment[1:])
+                    _flatten_cubic(current, c1, c2, end, tolerance, turn, points)
+                    current = end
+            merged = [points[0]]
+            for point in points[1:]:
+                if math.hypot(*(point - merged[-1])) >= MIN_SEGMENT_LENGTH:
+                    merged.append(point)
+            if len(merged) >= 2:
+                polylines.append(np.array(merged))
+    return polylines
+
+# stroke ordering
+
+def travel_distance(polylines, order, origin):
+    """
+    Pen up travel (mm, straight line) when drawing `order`, a list of
+    (polyline index, reversed) pairs, starting from `origin`.
+    """
+    position = np.asarray(origin, dtype=float)
+    total = 0.0
+    for (index, reverse) in order:
+        line = polylines[index][::-1] if reverse else polylines[index]
+        total += math.hypot(*(line[0] - position))
+        position = line[-1]
+    return total
+
+def order_strokes(polylines, origin, max_moves=MAX_2OPT_MOVES):
+    """
+    Order (and orient) the polylines to keep pen up travel short: a greedy
+    nearest neighbour tour refined with 2-opt moves, which reverse a run of
+    strokes (and the direction of each stroke in it), until no move helps.
+    Warns if the refinement is cut short after `max_moves` moves.
+    """
+    count = len(polylines)
+    if not count:
+        return []
+    starts = np.array([line[0] for line in polylines])
+    ends = np.array([line[-1] for line in polylines])
+    remaining = np.ones(count, dtype=bool)
+    position = np.asarray(origin, dtype=float)
+    order = []
+    for _ in range(count):
+        to_start = np.where(remaining, np.hypot(*(starts - position).T), np.inf)
+        to_end = np.where(remaining, np.hypot(*(ends - position).T), np.inf)
+        if to_start.min() <= to_end.min():
+            index, reverse = int(to_start.argmin()), False
+        else:
+            index, reverse = int(to_end.argmin()), True
+        order.append((index, reverse))
+        remaining[index] = False
+        position = starts[index] if reverse else ends[index]
+
+    # first and last point of every stroke in drawing order
+    first = np.array([ends[i] if r else starts[i] for (i, r) in order])
+    last = np.array([starts[i] if r else ends[i] for (i, r) in order])
+    moves = 0
+    improved = True
+    while improved:
+        improved = False
+        for k in range(count):
+            previous = np.asarray(origin, dtype=float) if k == 0 else last[k - 1]
+            # reversing strokes k..m replaces the travel into k and out of m
+            # (nothing follows the last stroke)
+            old = np.hypot(*(previous - first[k])) + np.append(np.hypot(*(last[k:-1] - first[k + 1:]).T), 0.0)
+            new = np.hypot(*(previous - last[k:]).T) + np.append(np.hypot(*(first[k] - first[k + 1:]).T), 0.0)
+            delta = new - old
+            best = int(delta.argmin())
+            if delta[best] >= -1e-9:
+                continue
+            j = k + best + 1
+            order[k:j] = [(i, not r) for (i, r) in reversed(order[k:j])]
+            first[k:j], last[k:j] = last[k:j][::-1].copy(), first[k:j][::-1].copy()
+            improved = True
+            moves += 1
+            if moves >= max_moves:
+                warnings.warn("stroke ordering stopped after %d 2-opt moves" % moves)
+                return order
+    return order
+
+# motion planning, on pen poses (pen position, heading) in page coordinates
+
+def sharp_corner(robot=DEFAULT_ROBOT, tolerance=DEFAULT_TOLERANCE):
+    """
+    Largest turn (radians) drawn with the pen down. A pivot swings the pen
+    around a wheel, moving it up to 2 r sin(angle / 2) away from the corner
+    (r the distance between pen and wheel), which has to stay within
+    `tolerance`.
+    """
+    radius = math.hypot(robot.pen_offset, 0.5 * robot.wheelbase)
+    return 2.0 * math.asin(min(1.0, 0.5 * tolerance / radius))
+
+class _Planner(object):
+
+    def __init__(self, robot, tolerance=DEFAULT_TOLERANCE):
+        self.robot = robot
+        self.sharp_corner = sharp_corner(robot, tolerance)
+        self.turn_rate = robot.turn_speed * robot.wheel_speed / 255.0 / robot.wheelbase
+        self.commands = []
+        self.pen = False
+        self.axle = (0.0, 0.0)
+        self.heading = -0.5 * math.pi
+
+    def speed(self, speed_pct):
+        return int(speed_pct * (255.0 / 100.0)) * self.robot.wheel_speed / 255.0
+
+    @property
+    def position(self):
+        return np.array((
+            self.axle[0] + self.robot.pen_offset * math.cos(self.heading),
+            self.axle[1] + self.robot.pen_offset * math.sin(self.heading)
+        ))
+
+    def run(self, commands):
+        commands = [c for c in commands if c.name == "pen" or c.args[-1] > 0]
+        if not commands:
+            return
+        trace = simulate(commands, self.robot, self.heading, self.axle)
+        last = len(trace.duration) - 1
+        self.heading = float(trace.heading[last] + trace.sweep[last])
+        self.axle = (
+            float(trace.pen_end[last, 0] - self.robot.pen_offset * math.cos(self.heading)),
+            float(trace.pen_end[last, 1] - self.robot.pen_offset * math.sin(self.heading))
+        )
+        self.commands.extend(commands)
+
+    def set_pen(self, down):
+        if self.pen != down:
+            self.commands.append(Command("pen", (down,)))
+            if PEN_SETTLE_MS:
+                self.commands.append(Command("wait", (PEN_SETTLE_MS,)))
+            self.pen = down
+
+    def pivot(self, position, heading, side, angle):
+        """
+        Pen poses after pivoting by `angle` (array, >= 0): side +1 is
+        turnLeft (around the left wheel), -1 turnRight.
+        """
+        robot = self.robot
+        wheel = (
+            position[0] - robot.pen_offset * math.cos(heading) + side * 0.5 * robot.wheelbase * math.sin(heading),
+            position[1] - robot.pen_offset * math.sin(heading) - side * 0.5 * robot.wheelbase * math.cos(heading)
+        )
+        return self._rotate(position, wheel, -side * angle), heading - side * angle
+
+    @staticmethod
+    def _rotate(point, center, angle):
+        cos, sin = np.cos(angle), np.sin(angle)
+        dx, dy = point[0] - center[0], point[1] - center[1]
+        return (center[0] + cos * dx - sin * dy, center[1] + sin * dx + cos * dy)
+
+    def _roots(self, residual):
+        # every root of residual(angle) on [0, 2 pi), by sampling and bisection
+        angles = np.linspace(0.0, 2.0 * math.pi, AIM_SAMPLES + 1)
+        values = residual(angles)
+        crossing = np.nonzero(np.signbit(values[:-1]) != np.signbit(values[1:]))[0]
+        low, high = angles[crossing], angles[crossing + 1]
+        low_values = values[crossing]
+        for _ in range(BISECTION_STEPS):
+            middle = 0.5 * (low + high)
+            middle_values = residual(middle)
+            same = np.signbit(middle_values) == np.signbit(low_values)
+            low = np.where(same, middle, low)
+            low_values = np.where(same, middle_values, low_values)
+            high = np.where(same, high, middle)
+        return 0.5 * (low + high)
+
+    def _turn_command(self, side, angle):
+        return Command("left" if side > 0 else "right", (int(round(1000.0 * angle / self.turn_rate)),))
+
+    def _drive_command(self, speed_pct, distance):
+        return Command("drive", (speed_pct, int(round(1000.0 * distance / self.speed(speed_pct)))))
+
+    def aim(self, target, speed_pct):
+        """
+        Commands pivoting the pen towards `target` and driving it there, or
+        None when no single pivot lines the pen up with the target.
+        """
+        position, heading = self.position, self.heading
+        target = np.asarray(target, dtype=float)
+        offset = target - position
+        if abs(_cross((math.cos(heading), math.sin(heading)), offset)) < 1e-6 \
+                and np.dot((math.cos(heading), math.sin(heading)), offset) >= 0.0:
+            return 0.0, [self._drive_command(speed_pct, math.hypot(*offset))]
+        best = None
+        for side in (1, -1):
+            def geometry(angle):
+                (x, y), h = self.pivot(position, heading, side, angle)
+                dx, dy = target[0] - x, target[1] - y
+                return np.cos(h) * dy - np.sin(h) * dx, np.cos(h) * dx + np.sin(h) * dy
+            angles = self._roots(lambda angle: geometry(angle)[0])
+            for angle in angles:
+                distance = float(geometry(angle)[1])
+                if distance < 0.0:
+                    continue
+                cost = angle / self.turn_rate + distance / self.speed(speed_pct)
+                if best is None or cost < best[0]:
+                    best = (cost, float(angle), [self._turn_command(side, angle), self._drive_command(speed_pct, distance)])
+        return None if best is None else best[1:]
+
+    def approach(self, target, target_heading):
+        """
+        Pen up commands (pivot, drive, pivot) that bring the pen to `target`
+        facing `target_heading`, or None if there are none.
+        """
+        robot = self.robot
+        position, heading = self.position, self.heading
+        target = np.asarray(target, dtype=float)
+        best = None
+        for final_side in (1, -1):
+            wheel = (
+                target[0] - robot.pen_offset * math.cos(target_heading) + final_side * 0.5 * robot.wheelbase * math.sin(target_heading),
+                target[1] - robot.pen_offset * math.sin(target_heading) - final_side * 0.5 * robot.wheelbase * math.cos(target_heading)
+            )
+            for first_side in (1, -1):
+                def geometry(angle):
+                    (x1, y1), h = self.pivot(position, heading, first_side, angle)
+                    final_angle = np.mod(final_side * (h - target_heading), 2.0 * math.pi)
+                    # pen pose before the final pivot
+                    x2, y2 = self._rotate(target, wheel, final_side * final_angle)
+                    dx, dy = x2 - x1, y2 - y1
+                    return np.cos(h) * dy - np.sin(h) * dx, np.cos(h) * dx + np.sin(h) * dy, final_angle
+                for angle in self._roots(lambda angle: geometry(angle)[0]):
+                    _, distance, final_angle = (float(v) for v in geometry(angle))
+                    if distance < 0.0:
+                        continue
+                    cost = (angle + final_angle) / self.turn_rate + distance / self.speed(TRAVEL_SPEED_PCT)
+                    if best is None or cost < best[0]:
+                        best = (cost, [
+                            self._turn_command(first_side, angle),
+                            self._drive_command(TRAVEL_SPEED_PCT, distance),
+                            self._turn_command(final_side, final_angle),
+                        ])
+        return None if best is None else best[1]
+
+    def travel_to(self, target, target_heading):
+        self.set_pen(False)
+        commands = self.approach(target, target_heading)
+        if commands is None:
+            self.move_to(target, TRAVEL_SPEED_PCT)
+        else:
+            self.run(commands)
+
+    def move_to(self, target, speed_pct):
+        for _ in range(MAX_AIM_RETRIES):
+            aimed = self.aim(target, speed_pct)
+            if aimed is not None:
+                self.run(aimed[1])
+                return
+            # nothing lines up from here: move on a bit and try again
+            self.set_pen(False)
+            self.run([self._drive_command(TRAVEL_SPEED_PCT, 0.5 * self.robot.wheelbase)])
+        raise CompileError("cannot reach (%.1f, %.1f)" % tuple(target))
+
+    def draw(self, polyline):
+        direction = polyline[1] - polyline[0]
+        self.travel_to(polyline[0], math.atan2(direction[1], direction[0]))
+        self.set_pen(True)
+        for i in range(1, len(polyline)):
+            aimed = self.aim(polyline[i], DRAW_SPEED_PCT)
+            if aimed is None or aimed[0] > self.sharp_corner:
+                direction = polyline[i] - polyline[i - 1]
+                self.travel_to(polyline[i - 1], math.atan2(direction[1], direction[0]))
+                self.set_pen(True)
+                self.move_to(polyline[i], DRAW_SPEED_PCT)
+            else:
+                self.run(aimed[1])
+        self.set_pen(False)
+
+def _merge(commands):
+    merged = []
+    for command in commands:
+        if command.name != "pen" and command.args[-1] <= 0:
+            continue
+        if merged and merged[-1].name == command.name and command.name != "pen" \
+                and merged[-1].args[:-1] == command.args[:-1]:
+            previous = merged.pop()
+            command = Command(command.name, command.args[:-1] + (previous.args[-1] + command.args[-1],))
+        merged.append(command)
+    return merged
+
+def compile_polylines(polylines, robot=DEFAULT_ROBOT, tolerance=DEFAULT_TOLERANCE):
+    """
+    Sketch commands drawing the polylines (mm, page coordinates) in the
+    given order, starting with the robot's axle at the origin facing up.
+    Pen down pivots stay within `tolerance` (mm) of the corners.
+    """
+    planner = _Planner(robot, tolerance)
+    for polyline in polylines:
+        planner.draw(polyline)
+    return _merge(planner.commands)
+
+def to_c(commands, function="drawPicture", comment=None, indent="  "):
+    lines = ["void %s()" % function, "{"]
+    if comment:
+        lines.extend("%s// %s" % (indent, line) for line in comment.splitlines())
+    for (name, args) in commands:
+        if name == "drive":
+            lines.append("%sdriveForward(%d, %d);" % (indent, args[0], args[1]))
+        elif name == "left":
+            lines.append("%sturnLeft(%d);" % (indent, args[0]))
+        elif name == "right":
+            lines.append("%sturnRight(%d);" % (indent, args[0]))
+        elif name == "wait":
+            lines.append("%swait(%d);" % (indent, args[0]))
+        elif name == "pen":
+            lines.append("%s%s();" % (indent, "penDown" if args[0] else "penUp"))
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+def place(polylines, robot=DEFAULT_ROBOT):
+    """
+    Move the polylines so the drawing sits START_CLEARANCE ahead of the pen
+    of a robot at the origin facing up the page, centered on it.
+    """
+    if not polylines:
+        return polylines
+    points = np.vstack(polylines)
+    left, top = points.min(axis=0)
+    right, bottom = points.max(axis=0)
+    offset = np.array((-0.5 * (left + right), -robot.pen_offset - START_CLEARANCE - bottom))
+    return [line + offset for line in polylines]
+
+def compile_svg(path, stroke=None, scale=None, tolerance=DEFAULT_TOLERANCE, robot=DEFAULT_ROBOT):
+    """
+    Compile an svg file. Returns (commands, statistics) where statistics
+    holds the number of strokes, pen up travel (mm) before and after
+    ordering and the estimated drawing time (s).
+    """
+    if scale is None:
+        scale = (1.0 * units.points).to(units.mm).magnitude
+    polylines = place(flatten(read_svg(path, stroke), scale, tolerance, robot), robot)
+    origin = (0.0, -robot.pen_offset)
+    order = order_strokes(polylines, origin)
+    ordered = [polylines[i][::-1] if reverse else polylines[i] for (i, reverse) in order]
+    commands = compile_polylines(ordered, robot, tolerance)
+    statistics = {
+        "strokes": len(polylines),
+        "travel_unordered": travel_distance(polylines, [(i, False) for i in range(len(polylines))], origin),
+        "travel": travel_distance(polylines, order, origin),
+        "time": drawing_time(commands, robot),
+    }
+    return commands, statistics
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile an SVG drawing into a drawPicture() function.")
+    parser.add_argument("svg", help="svg file to compile")
+    parser.add_argument("--stroke", help="only draw paths stroked in this color, e.g. 'rgb(100%%,0%%,0%%)'")
+    parser.add_argument("--scale", type=float, help="mm per svg point (default: true size)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+        help="maximum curve flattening error in mm (default: %(default)s)")
+    parser.add_argument("--function", default="drawPicture", help="name of the generated function")
+    parser.add_argument("--preview", metavar="SVG", help="also write a simulated preview of the result")
+    args = parser.parse_args(argv)
+
+    try:
+        commands, statistics = compile_svg(args.svg, args.stroke, args.scale, args.tolerance)
+    except CompileError as e:
+        print("%s: %s" % (args.svg, e), file=sys.stderr)
+        return 1
+    comment = (
+        "generated from %s\n"
+        "%d strokes, %.0f mm pen up travel (%.0f mm unordered)\n"
+        "estimated drawing time %.1f s"
+    ) % (args.svg, statistics["strokes"], statistics["travel"], statistics["travel_unordered"], statistics["time"])
+    sys.stdout.write(to_c(commands, args.function, comment))
+    if args.preview:
+        render_preview(simulate(commands), args.preview)
+    print(comment.replace("\n", ", "), file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
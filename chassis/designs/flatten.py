@@ -0,0 +1,139 @@
+"""
+Arc flattening for consumers that only understand straight lines.
+
+Every arc is replaced by the fewest chords that stay within a chord error
+`tolerance` of it: a chord spanning the angle s sits r * (1 - cos(s / 2)) away
+from the arc at its middle, so an arc of radius r and sweep S needs
+
+    n = ceil(|S| / (2 * acos(1 - tolerance / r)))
+
+equal chords. The unit circle points of each (radius, tolerance, sweep)
+combination are computed once and cached; a sheet only has a handful of them
+(corner roundings, mounting holes) and all arcs sharing one are rotated,
+scaled and moved into place in a single numpy operation.
+
+    store = GeometryStore.from_strokes(recording.strokes)
+    points, offsets = flatten_store(store, FLATTEN_TOLERANCE.to(units.points).magnitude)
+"""
+import math
+
+import numpy as np
+
+from .chassis import units
+from .geometry import ARC, LINE, GeometryStore
+from .recording import Stroke
+
+# maximum distance between an arc and its chords, well below the laser kerf
+FLATTEN_TOLERANCE = 0.01 * units.mm
+# decimals kept in the tessellation cache keys
+KEY_DIGITS = 9
+
+_TESSELLATION_CACHE = {}
+
+def clear_cache():
+    _TESSELLATION_CACHE.clear()
+
+def segment_count(radius, sweep, tolerance):
+    """
+    Smallest number of equal chords approximating an arc within `tolerance`
+    (works on numpy arrays too).
+    """
+    ratio = np.clip(1.0 - tolerance / np.maximum(radius, tolerance), -1.0, 1.0)
+    # no single chord spans more than half a circle
+    step = np.minimum(2.0 * np.arccos(ratio), math.pi)
+    count = np.ceil(np.abs(sweep) / np.where(step > 0.0, step, 1.0) - 1e-12)
+    return np.maximum(count, 1).astype(np.int64)
+
+def unit_tessellation(radius, sweep, tolerance):
+    """
+    Cached points (n + 1 by 2) of a unit circle arc starting at angle 0 and
+    sweeping `sweep`, with as many chords as an arc of `radius` needs.
+    """
+    key = (round(radius, KEY_DIGITS), round(tolerance, KEY_DIGITS), round(sweep, KEY_DIGITS))
+    points = _TESSELLATION_CACHE.get(key)
+    if points is None:
+        angles = np.linspace(0.0, key[2], int(segment_count(key[0], key[2], key[1])) + 1)
+        points = np.column_stack((np.cos(angles), np.sin(angles)))
+        points.setflags(write=False)
+        _TESSELLATION_CACHE[key] = points
+    return points
+
+def _place(unit, center, radius, start_angle):
+    # unit tessellation rotated to start_angle, scaled and moved, for k arcs
+    cos, sin = np.cos(start_angle)[:, np.newaxis], np.sin(start_angle)[:, np.newaxis]
+    x = cos * unit[:, 0] - sin * unit[:, 1]
+    y = sin * unit[:, 0] + cos * unit[:, 1]
+    r = radius[:, np.newaxis]
+    return np.stack((center[:, 0:1] + r * x, center[:, 1:2] + r * y), axis=-1)
+
+def arc_points(center, radius, a1, a2, tolerance):
+    """
+    Points (n + 1 by 2) of a single arc from angle a1 to a2, as recorded
+    (a2 < a1 for arc_negative).
+    """
+    unit = unit_tessellation(radius, a2 - a1, tolerance)
+    return _place(unit, np.array((center,), dtype=float), np.array((radius,), dtype=float), np.array((a1,)))[0]
+
+def flatten_store(store, tolerance):
+    """
+    Flatten every contour of a GeometryStore into a polyline. Returns
+    (points, offsets): contour k becomes points[offsets[k]:offsets[k + 1]],
+    starting with its first point. Closing lines of closed contours are not
+    repeated.
+    """
+    segment_total = len(store.kind)
+    contour_total = len(store)
+    counts = np.ones(segment_total, dtype=np.int64)
+    arcs = np.nonzero(store.kind == ARC)[0]
+    arc_index = store.arc[arcs]
+    radius = store.radius[arc_index]
+    sweep = store.angles[arc_index, 1] - store.angles[arc_index, 0]
+    counts[arcs] = segment_count(radius, sweep, tolerance)
+
+    # every contour has its start point before the points of its segments
+    contour_of_segment = np.repeat(np.arange(contour_total), np.diff(store.contour_offset))
+    position = np.cumsum(counts) - counts + contour_of_segment + 1
+    offsets = np.zeros(contour_total + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.add.reduceat(counts, store.contour_offset[:-1]) + 1) \
+        if segment_total else np.arange(1, contour_total + 1)
+    points = np.empty((int(offsets[-1]), 2))
+    points[offsets[:-1]] = store.start[store.contour_offset[:-1]]
+    lines = np.nonzero(store.kind == LINE)[0]
+    points[position[lines]] = store.end[lines]
+
+    if len(arcs):
+        keys = np.column_stack((np.round(store.radius[arc_index], KEY_DIGITS), np.round(sweep, KEY_DIGITS)))
+        unique, group = np.unique(keys, axis=0, return_inverse=True)
+        group = group.reshape(-1)
+        for (g, (r, s)) in enumerate(unique):
+            members = np.nonzero(group == g)[0]
+            unit = unit_tessellation(float(r), float(s), tolerance)
+            placed = _place(unit, store.center[arc_index[members]], store.radius[arc_index[members]],
+                store.angles[arc_index[members], 0])
+            n = len(unit) - 1
+            target = position[arcs[members]][:, np.newaxis] + np.arange(n)
+            points[target] = placed[:, 1:]
+    return points, offsets
+
+def flatten_strokes(strokes, tolerance):
+    """
+    Recorded strokes with every arc replaced by lines, for replay() into
+    backends that cannot draw arcs.
+    """
+    store = GeometryStore.from_strokes(strokes)
+    points, offsets = flatten_store(store, tolerance)
+    points = points.tolist()
+    flattened = []
+    previous_stroke = None
+    for contour in store:
+        line = points[offsets[contour.index]:offsets[contour.index + 1]]
+        ops = [("M",) + tuple(line[0])] + [("L",) + tuple(p) for p in line[1:]]
+        if contour.closed:
+            ops.append(("Z",))
+        stroke = store.stroke[contour.index]
+        if previous_stroke == stroke:
+            flattened[-1] = Stroke(flattened[-1].style, flattened[-1].ops + tuple(ops))
+        else:
+            flattened.append(Stroke(contour.style, tuple(ops)))
+        previous_stroke = stroke
+    return flattened
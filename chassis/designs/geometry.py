@@ -0,0 +1,348 @@
+"""
+Compact, array backed storage for recorded geometry.
+
+A GeometryStore keeps the contours of a recording as a handful of typed numpy
+arrays instead of one python object per segment, so sheets with hundreds of
+chassis stay small. Stores can be saved to a single file and loaded back as
+read-only memory maps: batch workers opening the same file share its pages,
+and pickling a loaded store only sends the file name.
+
+    recording = RecordingContext()
+    render_sheet(recording, TESSELATION_COUNT_H, TESSELATION_COUNT_V)
+    store = GeometryStore.from_strokes(recording.strokes)
+    store.save("sheet.geom")
+    store = GeometryStore.load("sheet.geom")
+"""
+import json
+import struct
+
+import numpy as np
+
+from .recording import POINT_EPSILON, Stroke, segment_start, subpaths
+
+LINE = 0
+ARC = 1
+
+FILE_MAGIC = b"GEOMSTR1"
+FILE_ALIGNMENT = 64
+
+# name, dtype and trailing shape of every array in a store
+#   kind            per segment, LINE or ARC
+#   start, end      per segment end points
+#   arc             per segment index into the arc arrays, -1 for lines
+#   center, radius, angles
+#                   per arc, angles are (a1, a2), a2 < a1 for arc_negative
+#   contour_offset  index of the first segment of every contour, plus the
+#                   total number of segments
+#   closed          per contour, whether it ended with close_path
+#   implicit_close  per contour, whether its last segment is the line that
+#                   close_path added (and not one drawn explicitly)
+#   style           per contour index into the style table
+#   stroke          per contour index of the stroke it was drawn with
+ARRAYS = (
+    ("kind", np.uint8, ()),
+    ("start", np.float64, (2,)),
+    ("end", np.float64, (2,)),
+    ("arc", np.int32, ()),
+    ("center", np.float64, (2,)),
+    ("radius", np.float64, ()),
+    ("angles", np.float64, (2,)),
+    ("contour_offset", np.int64, ()),
+    ("closed", np.bool_, ()),
+    ("implicit_close", np.bool_, ()),
+    ("style", np.uint16, ()),
+    ("stroke", np.int32, ()),
+)
+
+def _aligned(size):
+    return -(-size // FILE_ALIGNMENT) * FILE_ALIGNMENT
+
+def _coincident(p, q):
+    return abs(p[0] - q[0]) <= POINT_EPSILON and abs(p[1] - q[1]) <= POINT_EPSILON
+
+def _style_key(style):
+    width, color, dash = style
+    return (float(width), tuple(float(c) for c in color), tuple(float(d) for d in dash))
+
+class Contour(object):
+    """
+    Light-weight view of one contour of a GeometryStore.
+    """
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __len__(self):
+        offsets = self.store.contour_offset
+        return int(offsets[self.index + 1] - offsets[self.index])
+
+    @property
+    def segments(self):
+        offsets = self.store.contour_offset
+        return slice(int(offsets[self.index]), int(offsets[self.index + 1]))
+
+    @property
+    def style(self):
+        return self.store.styles[self.store.style[self.index]]
+
+    @property
+    def closed(self):
+        return bool(self.store.closed[self.index])
+
+    def ops(self):
+        """
+        The contour as recorded path operations.
+        """
+        store = self.store
+        segments = self.segments
+        # the line close_path added is left to close_path again
+        stop = segments.stop - 1 if store.implicit_close[self.index] else segments.stop
+        ops = [("M",) + tuple(float(v) for v in store.start[segments.start])]
+        for i in range(segments.start, stop):
+            if store.kind[i] == LINE:
+                ops.append(("L",) + tuple(float(v) for v in store.end[i]))
+            else:
+                a = store.arc[i]
+                ops.append(("A",)
+                    + tuple(float(v) for v in store.center[a])
+                    + (float(store.radius[a]),)
+                    + tuple(float(v) for v in store.angles[a]))
+        if self.closed:
+            ops.append(("Z",))
+        return ops
+
+class GeometryStore(object):
+    """
+    Contours of a recording in struct-of-arrays form (see ARRAYS). `styles`
+    is the table of (width, color, dash) tuples the contours index into.
+    """
+
+    def __init__(self, styles, path=None, **arrays):
+        self.styles = list(styles)
+        self.path = path
+        for (name, dtype, shape) in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def empty(cls):
+        arrays = dict(
+            (name, np.zeros((0,) + shape, dtype=dtype)) for (name, dtype, shape) in ARRAYS
+        )
+        arrays["contour_offset"] = np.zeros(1, dtype=np.int64)
+        return cls([], **arrays)
+
+    @classmethod
+    def from_strokes(cls, strokes):
+        styles = []
+        style_index = {}
+        kind, start, end, arc = [], [], [], []
+        center, radius, angles = [], [], []
+        contour_offset, closed, implicit_close, style, stroke = [0], [], [], [], []
+        for (stroke_index, (stroke_style, ops)) in enumerate(strokes):
+            key = _style_key(stroke_style)
+            if key not in style_index:
+                style_index[key] = len(styles)
+                styles.append(key)
+            for (subpath_ops, segments, _) in subpaths(ops):
+                if not segments:
+                    continue
+                for segment in segments:
+                    if segment[0] == "L":
+                        kind.append(LINE)
+                        start.append(segment[1])
+                        end.append(segment[2])
+                        arc.append(-1)
+                    else:
+                        (cx, cy), r, a1, a2 = segment[1:]
+                        kind.append(ARC)
+                        start.append(segment_start(segment))
+                        end.append((cx + r * np.cos(a2), cy + r * np.sin(a2)))
+                        arc.append(len(radius))
+                        center.append((cx, cy))
+                        radius.append(r)
+                        angles.append((a1, a2))
+                contour_offset.append(len(kind))
+                closed.append(subpath_ops[-1][0] == "Z")
+                # close_path only adds a line when it is not at the start yet
+                implicit_close.append(bool(
+                    closed[-1] and segments[-1][0] == "L" and len(subpath_ops) > 1
+                    and not (subpath_ops[-2][0] == "L" and _coincident(subpath_ops[-2][1:3], subpath_ops[0][1:3]))
+                    and _coincident(segments[-1][2], subpath_ops[0][1:3])
+                ))
+                style.append(style_index[key])
+                stroke.append(stroke_index)
+        values = dict(
+            kind=kind, start=start, end=end, arc=arc,
+            center=center, radius=radius, angles=angles,
+            contour_offset=contour_offset, closed=closed, implicit_close=implicit_close,
+            style=style, stroke=stroke
+        )
+        arrays = dict(
+            (name, np.array(values[name], dtype=dtype).reshape((-1,) + shape))
+            for (name, dtype, shape) in ARRAYS
+        )
+        return cls(styles, **arrays)
+
+    @classmethod
+    def concatenate(cls, stores):
+        """
+        Join several stores into one, merging their style tables.
+        """
+        stores = list(stores)
+        if not stores:
+            return cls.empty()
+        styles = []
+        style_index = {}
+        parts = dict((name, []) for (name, dtype, shape) in ARRAYS)
+        segment_count = arc_count = stroke_count = 0
+        for store in stores:
+            remap = []
+            for s in store.styles:
+                if s not in style_index:
+                    style_index[s] = len(styles)
+                    styles.append(s)
+                remap.append(style_index[s])
+            for (name, dtype, shape) in ARRAYS:
+                parts[name].append(getattr(store, name))
+            parts["arc"][-1] = np.where(store.arc >= 0, store.arc + arc_count, -1)
+            parts["contour_offset"][-1] = store.contour_offset[1:] + segment_count
+            parts["style"][-1] = np.array(remap, dtype=np.uint16)[store.style]
+            parts["stroke"][-1] = store.stroke + stroke_count
+            segment_count += len(store.kind)
+            arc_count += len(store.radius)
+            if len(store.stroke):
+                stroke_count += int(store.stroke.max()) + 1
+        parts["contour_offset"].insert(0, np.zeros(1, dtype=np.int64))
+        arrays = dict(
+            (name, np.concatenate(parts[name]).astype(dtype, copy=False))
+            for (name, dtype, shape) in ARRAYS
+        )
+        return cls(styles, **arrays)
+
+    def translated(self, dx, dy):
+        """
+        A copy of the store moved by (dx, dy), e.g. to lay out a sheet.
+        """
+        arrays = dict((name, getattr(self, name)) for (name, dtype, shape) in ARRAYS)
+        offset = np.array((dx, dy), dtype=np.float64)
+        for name in ("start", "end", "center"):
+            arrays[name] = arrays[name] + offset
+        return GeometryStore(self.styles, **arrays)
+
+    def __len__(self):
+        return len(self.closed)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("contour index out of range")
+        return Contour(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield Contour(self, index)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for (name, dtype, shape) in ARRAYS)
+
+    def bounds(self):
+        """
+        (min x, min y, max x, max y) of all segment end points and arcs.
+        Arcs are bounded by their full circle.
+        """
+        if not len(self.kind):
+            return None
+        points = [self.start, self.end]
+        if len(self.radius):
+            r = self.radius[:, np.newaxis]
+            points.extend((self.center - r, self.center + r))
+        points = np.concatenate(points)
+        return tuple(float(v) for v in np.concatenate((points.min(axis=0), points.max(axis=0))))
+
+    def to_strokes(self):
+        """
+        The stored contours as recorded strokes, for replay(), with the same
+        path operations as the original recording.
+        """
+        strokes = []
+        previous_stroke = None
+        for contour in self:
+            ops = contour.ops()
+            stroke = self.stroke[contour.index]
+            if previous_stroke == stroke:
+                strokes[-1] = Stroke(strokes[-1].style, strokes[-1].ops + tuple(ops))
+            else:
+                strokes.append(Stroke(contour.style, tuple(ops)))
+            previous_stroke = stroke
+        return strokes
+
+    def save(self, path):
+        """
+        Write the store to a single file whose arrays can be memory mapped by
+        load(): a magic number, the length of a JSON header, the header and
+        then the raw (aligned) array data.
+        """
+        arrays = []
+        size = 0
+        for (name, dtype, shape) in ARRAYS:
+            array = np.ascontiguousarray(getattr(self, name), dtype=dtype)
+            arrays.append((name, array, size))
+            size += _aligned(array.nbytes)
+        header = json.dumps({
+            "styles": [[width, list(color), list(dash)] for (width, color, dash) in self.styles],
+            "arrays": dict(
+                (name, {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset})
+                for (name, array, offset) in arrays
+            ),
+        }).encode("utf-8")
+        data_start = _aligned(len(FILE_MAGIC) + 8 + len(header))
+        with open(path, "wb") as f:
+            f.write(FILE_MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            for (name, array, offset) in arrays:
+                f.seek(data_start + offset)
+                f.write(array.tobytes())
+            f.truncate(data_start + size)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Read a store written by save(). With `mmap` the arrays are read-only
+        views into a memory map of the file, otherwise they are copied.
+        """
+        with open(path, "rb") as f:
+            if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                raise ValueError("%s is not a geometry store" % path)
+            (length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(length).decode("utf-8"))
+        data_start = _aligned(len(FILE_MAGIC) + 8 + length)
+        if mmap:
+            data = np.memmap(path, dtype=np.uint8, mode="r")
+        else:
+            data = np.fromfile(path, dtype=np.uint8)
+        arrays = {}
+        for (name, dtype, shape) in ARRAYS:
+            entry = header["arrays"][name]
+            dtype = np.dtype(entry["dtype"])
+            count = int(np.prod(entry["shape"], dtype=np.int64))
+            begin = data_start + entry["offset"]
+            arrays[name] = np.asarray(
+                data[begin:begin + count * dtype.itemsize]
+            ).view(dtype).reshape(entry["shape"])
+        styles = [_style_key(s) for s in header["styles"]]
+        return cls(styles, path=path if mmap else None, **arrays)
+
+    def __reduce__(self):
+        if self.path is not None:
+            # memory mapped: let the receiving process map the same file
+            return (GeometryStore.load, (self.path,))
+        arrays = dict((name, getattr(self, name)) for (name, dtype, shape) in ARRAYS)
+        return (_restore, (self.styles, arrays))
+
+def _restore(styles, arrays):
+    return GeometryStore(styles, **arrays)
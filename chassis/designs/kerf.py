@@ -0,0 +1,308 @@
+"""
+Kerf compensation for recorded cut lines.
+
+A laser cutter removes a strip of material as wide as its kerf, centered on
+the cut line, so parts come out too small and holes too large by half a kerf
+on every side. compensate() moves every closed cut contour half a kerf away
+from the material: outward for outer boundaries and inward for holes and
+slots. Lines are offset along their normal, arcs by changing their radius and
+corners are re-joined by intersecting the offset segments.
+
+Contours that only differ by a translation (every M3 hole, every rounded
+corner of a tesselated sheet) share one cached offset computation and one
+flattened polygon, and holes are found through a grid of bounding boxes
+instead of testing every pair of contours.
+"""
+import math
+
+from .recording import Stroke, POINT_EPSILON, arc_point, segment_start, segment_end, subpaths
+
+# distance (in points) below which offset segments are considered joined
+JOIN_EPSILON = 1e-7
+# corners sharper than this (ratio of miter length to offset) are bevelled,
+# same default as cairo's miter limit
+MITER_LIMIT = 10.0
+# resolution of the polygons used to decide which contours are holes
+CONTAINMENT_SEGMENTS_PER_TURN = 64
+# decimals kept in the translation independent template cache keys
+TEMPLATE_DIGITS = 9
+
+_OFFSET_CACHE = {}
+_POLYGON_CACHE = {}
+
+def clear_cache():
+    _OFFSET_CACHE.clear()
+    _POLYGON_CACHE.clear()
+
+def _distance(p, q):
+    return math.hypot(p[0] - q[0], p[1] - q[1])
+
+def _wrap(angle):
+    # map an angle difference onto (-pi, pi]
+    return angle - 2.0 * math.pi * math.ceil((angle - math.pi) / (2.0 * math.pi))
+
+def _signed_area(segments):
+    area = 0.0
+    for segment in segments:
+        if segment[0] == "L":
+            (x0, y0), (x1, y1) = segment[1], segment[2]
+            area += 0.5 * (x0 * y1 - x1 * y0)
+        else:
+            (cx, cy), r, a1, a2 = segment[1:]
+            area += 0.5 * (
+                r * cx * (math.sin(a2) - math.sin(a1))
+                - r * cy * (math.cos(a2) - math.cos(a1))
+                + r * r * (a2 - a1)
+            )
+    return area
+
+def _flatten(segments):
+    points = []
+    for segment in segments:
+        if segment[0] == "L":
+            points.append(segment[1])
+        else:
+            center, r, a1, a2 = segment[1:]
+            n = max(1, int(math.ceil(abs(a2 - a1) / (2.0 * math.pi) * CONTAINMENT_SEGMENTS_PER_TURN)))
+            points.extend(arc_point(center, r, a1 + (a2 - a1) * i / n) for i in range(n))
+    return points
+
+def _contains(polygon, point):
+    # even-odd ray casting
+    x, y = point
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        (xi, yi), (xj, yj) = polygon[i], polygon[j]
+        if (yi > y) != (yj > y) and x < xi + (y - yi) * (xj - xi) / (yj - yi):
+            inside = not inside
+        j = i
+    return inside
+
+def _bounds(points):
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def _strictly_inside(inner, outer):
+    return (inner[0] > outer[0] + POINT_EPSILON and inner[1] > outer[1] + POINT_EPSILON
+        and inner[2] < outer[2] - POINT_EPSILON and inner[3] < outer[3] - POINT_EPSILON)
+
+def _offset_segment(segment, distance):
+    # offset to the right of the direction of travel
+    if segment[0] == "L":
+        (x0, y0), (x1, y1) = segment[1], segment[2]
+        length = math.hypot(x1 - x0, y1 - y0)
+        nx = distance * (y1 - y0) / length
+        ny = -distance * (x1 - x0) / length
+        return ["L", (x0 + nx, y0 + ny), (x1 + nx, y1 + ny)]
+    center, r, a1, a2 = segment[1:]
+    radius = r + distance if a2 > a1 else r - distance
+    if radius <= POINT_EPSILON:
+        raise ValueError("kerf offset of %r collapses an arc of radius %r" % (distance, r))
+    return ["A", center, radius, a1, a2]
+
+def _intersections(a, b):
+    if a[0] == "A" and b[0] == "L":
+        return _intersections(b, a)
+    if a[0] == "L" and b[0] == "L":
+        (px, py), (qx, qy) = a[1], b[1]
+        rx, ry = a[2][0] - px, a[2][1] - py
+        sx, sy = b[2][0] - qx, b[2][1] - qy
+        denominator = rx * sy - ry * sx
+        if abs(denominator) <= POINT_EPSILON * math.hypot(rx, ry) * math.hypot(sx, sy):
+            return []
+        t = ((qx - px) * sy - (qy - py) * sx) / denominator
+        return [(px + t * rx, py + t * ry)]
+    if a[0] == "L":
+        (px, py), (cx, cy), r = a[1], b[1], b[2]
+        dx, dy = a[2][0] - px, a[2][1] - py
+        fx, fy = px - cx, py - cy
+        qa = dx * dx + dy * dy
+        qb = 2.0 * (fx * dx + fy * dy)
+        qc = fx * fx + fy * fy - r * r
+        discriminant = qb * qb - 4.0 * qa * qc
+        if discriminant < 0.0:
+            return []
+        root = math.sqrt(discriminant)
+        return [(px + t * dx, py + t * dy) for t in ((-qb - root) / (2.0 * qa), (-qb + root) / (2.0 * qa))]
+    (x0, y0), r0, (x1, y1), r1 = a[1], a[2], b[1], b[2]
+    d = math.hypot(x1 - x0, y1 - y0)
+    if d <= POINT_EPSILON or d > r0 + r1 or d < abs(r0 - r1):
+        return []
+    along = (r0 * r0 - r1 * r1 + d * d) / (2.0 * d)
+    across = math.sqrt(max(0.0, r0 * r0 - along * along))
+    mx, my = x0 + along * (x1 - x0) / d, y0 + along * (y1 - y0) / d
+    return [
+        (mx + across * (y1 - y0) / d, my - across * (x1 - x0) / d),
+        (mx - across * (y1 - y0) / d, my + across * (x1 - x0) / d),
+    ]
+
+def _set_end(segment, point):
+    if segment[0] == "L":
+        segment[2] = point
+    else:
+        angle = math.atan2(point[1] - segment[1][1], point[0] - segment[1][0])
+        segment[4] += _wrap(angle - segment[4])
+
+def _set_start(segment, point):
+    if segment[0] == "L":
+        segment[1] = point
+    else:
+        angle = math.atan2(point[1] - segment[1][1], point[0] - segment[1][0])
+        segment[3] += _wrap(angle - segment[3])
+
+def _offset_contour(segments, distance):
+    """
+    Offset a closed contour by `distance` to the right of its direction of
+    travel and return it as path operations.
+    """
+    offset = [_offset_segment(segment, distance) for segment in segments]
+    joined = []
+    for i, (a, b) in enumerate(zip(offset, offset[1:] + offset[:1])):
+        joined.append(a)
+        if _distance(segment_end(a), segment_start(b)) <= JOIN_EPSILON:
+            continue
+        vertex = segment_end(segments[i])
+        candidates = sorted(_intersections(a, b), key=lambda p: _distance(p, vertex))
+        if candidates and _distance(candidates[0], vertex) <= MITER_LIMIT * abs(distance):
+            _set_end(a, candidates[0])
+            _set_start(b, candidates[0])
+        else:
+            # bevel
+            joined.append(["L", segment_end(a), segment_start(b)])
+    ops = [("M",) + segment_start(joined[0])]
+    for segment in joined:
+        if segment[0] == "L":
+            ops.append(("L",) + segment[2])
+        else:
+            ops.append(("A",) + segment[1] + tuple(segment[2:]))
+    ops.append(("Z",))
+    return ops
+
+def _template(segments, origin):
+    ox, oy = origin
+    key = []
+    for segment in segments:
+        if segment[0] == "L":
+            key.append(("L",
+                round(segment[1][0] - ox, TEMPLATE_DIGITS), round(segment[1][1] - oy, TEMPLATE_DIGITS),
+                round(segment[2][0] - ox, TEMPLATE_DIGITS), round(segment[2][1] - oy, TEMPLATE_DIGITS)))
+        else:
+            key.append(("A",
+                round(segment[1][0] - ox, TEMPLATE_DIGITS), round(segment[1][1] - oy, TEMPLATE_DIGITS),
+                round(segment[2], TEMPLATE_DIGITS),
+                round(segment[3], TEMPLATE_DIGITS), round(segment[4], TEMPLATE_DIGITS)))
+    return tuple(key)
+
+def _translate(ops, dx, dy):
+    translated = []
+    for op in ops:
+        if op[0] in ("M", "L"):
+            translated.append((op[0], op[1] + dx, op[2] + dy))
+        elif op[0] == "A":
+            translated.append(("A", op[1] + dx, op[2] + dy) + op[3:])
+        else:
+            translated.append(op)
+    return translated
+
+def _relative(segments, origin):
+    return [
+        ["L", (s[1][0] - origin[0], s[1][1] - origin[1]), (s[2][0] - origin[0], s[2][1] - origin[1])]
+        if s[0] == "L" else
+        ["A", (s[1][0] - origin[0], s[1][1] - origin[1])] + list(s[2:])
+        for s in segments
+    ]
+
+def _cached_offset(template, origin, segments, distance):
+    key = (template, round(distance, TEMPLATE_DIGITS))
+    ops = _OFFSET_CACHE.get(key)
+    if ops is None:
+        ops = _offset_contour(_relative(segments, origin), distance)
+        _OFFSET_CACHE[key] = ops
+    return _translate(ops, origin[0], origin[1])
+
+def _cached_polygon(template, origin, segments):
+    # flattened contour and its bounds, relative to origin
+    entry = _POLYGON_CACHE.get(template)
+    if entry is None:
+        polygon = [(x - origin[0], y - origin[1]) for (x, y) in _flatten(segments)]
+        entry = (polygon, _bounds(polygon))
+        _POLYGON_CACHE[template] = entry
+    return entry
+
+def offset_contour(segments, distance):
+    """
+    Cached _offset_contour(). Contours are cached relative to their first
+    point, so every translated copy of a feature reuses the same result.
+    """
+    origin = segment_start(segments[0])
+    return _cached_offset(_template(segments, origin), origin, segments, distance)
+
+def _grid(bounds):
+    # uniform grid over the bounding boxes, cells about the size of an
+    # average box; every box is entered in all the cells it overlaps
+    area = sum((b[2] - b[0]) * (b[3] - b[1]) for b in bounds)
+    cell = max(math.sqrt(area / len(bounds)), POINT_EPSILON)
+    cells = {}
+    for i, b in enumerate(bounds):
+        for x in range(int(math.floor(b[0] / cell)), int(math.floor(b[2] / cell)) + 1):
+            for y in range(int(math.floor(b[1] / cell)), int(math.floor(b[3] / cell)) + 1):
+                cells.setdefault((x, y), []).append(i)
+    return cell, cells
+
+def _depths(contours):
+    """
+    Number of other contours every contour lies inside. A container's box
+    holds the whole box of the contour, so only the contours sharing the grid
+    cell of the box corner are tested.
+    """
+    bounds = [(b[0] + ox, b[1] + oy, b[2] + ox, b[3] + oy) for (_, (ox, oy), _, b) in contours]
+    cell, cells = _grid(bounds)
+    depths = []
+    for i, (_, origin, polygon, _) in enumerate(contours):
+        x, y = polygon[0][0] + origin[0], polygon[0][1] + origin[1]
+        candidates = cells[(int(math.floor(bounds[i][0] / cell)), int(math.floor(bounds[i][1] / cell)))]
+        depths.append(sum(
+            1 for j in candidates
+            if j != i and _strictly_inside(bounds[i], bounds[j])
+            and _contains(contours[j][2], (x - contours[j][1][0], y - contours[j][1][1]))
+        ))
+    return depths
+
+def compensate(strokes, kerf, cut_color):
+    """
+    Return a copy of the recorded strokes where every closed contour stroked
+    in `cut_color` is moved half the kerf (in points) away from the material.
+    A contour is a hole when it lies inside an odd number of other cut
+    contours. Open cut paths and all other strokes are left untouched.
+    """
+    parsed = []
+    contours = []
+    for stroke in strokes:
+        stroke_subpaths = list(subpaths(stroke.ops))
+        parsed.append(stroke_subpaths)
+        if tuple(stroke.style[1]) != tuple(cut_color):
+            continue
+        for (ops, segments, closed) in stroke_subpaths:
+            if closed and segments:
+                origin = segment_start(segments[0])
+                template = _template(segments, origin)
+                polygon, bounds = _cached_polygon(template, origin, segments)
+                contours.append((segments, origin, polygon, bounds, template))
+
+    offsets = {}
+    if contours:
+        depths = _depths([c[:4] for c in contours])
+        for ((segments, origin, polygon, bounds, template), depth) in zip(contours, depths):
+            grow = 0.5 * kerf if depth % 2 == 0 else -0.5 * kerf
+            area = _signed_area(segments)
+            offsets[id(segments)] = _cached_offset(template, origin, segments, grow if area > 0 else -grow)
+
+    compensated = []
+    for stroke, stroke_subpaths in zip(strokes, parsed):
+        ops = []
+        for (subpath_ops, segments, closed) in stroke_subpaths:
+            ops.extend(offsets.get(id(segments), subpath_ops))
+        compensated.append(Stroke(stroke.style, tuple(ops)))
+    return compensated
@@ -0,0 +1,203 @@
+import math
+from collections import namedtuple
+
+# A stroked path as it would reach the backend. `style` is a
+# (width, rgba, dash) triple in points, `ops` is a tuple of operations:
+#   ("M", x, y)                      start a new sub path
+#   ("L", x, y)                      straight line from the current point
+#   ("A", cx, cy, radius, a1, a2)    circular arc, a2 < a1 means arc_negative
+#   ("Z",)                           close the current sub path
+# Like cairo, an arc is joined to the current point by a straight line; the
+# line is only recorded when it has a non-zero length.
+Stroke = namedtuple("Stroke", "style ops")
+
+# distances (in points) below which two points are considered coincident
+POINT_EPSILON = 1e-9
+
+class RecordingContext(object):
+    """
+    Stand-in for a cairo.Context that records the path operations of every
+    stroke instead of drawing them. Only the subset of the cairo API used by
+    the design scripts is implemented. Coordinates are recorded in device
+    space (i.e. with the current translation applied) and arcs keep the
+    angles that cairo would draw them with.
+    """
+
+    def __init__(self):
+        self.strokes = []
+        self._matrix = (0.0, 0.0)
+        self._style = (1.0, (0.0, 0.0, 0.0, 1.0), ())
+        self._stack = []
+        self._path = []
+        self._current = None
+        self._subpath_start = None
+
+    # state
+
+    def save(self):
+        self._stack.append((self._matrix, self._style))
+
+    def restore(self):
+        self._matrix, self._style = self._stack.pop()
+
+    def identity_matrix(self):
+        self._matrix = (0.0, 0.0)
+
+    def translate(self, tx, ty):
+        self._matrix = (self._matrix[0] + tx, self._matrix[1] + ty)
+
+    def set_line_width(self, width):
+        self._style = (float(width), self._style[1], self._style[2])
+
+    def set_source_rgba(self, r, g, b, a=1.0):
+        self._style = (self._style[0], (float(r), float(g), float(b), float(a)), self._style[2])
+
+    def set_dash(self, dashes, offset=0):
+        self._style = (self._style[0], self._style[1], tuple(float(d) for d in dashes))
+
+    # path construction
+
+    def _device(self, x, y):
+        return (x + self._matrix[0], y + self._matrix[1])
+
+    def _move(self, point):
+        self._path.append(("M",) + point)
+        self._current = point
+        self._subpath_start = point
+
+    def _line(self, point):
+        if self._current is None:
+            self._move(point)
+        else:
+            self._path.append(("L",) + point)
+            self._current = point
+
+    def move_to(self, x, y):
+        self._move(self._device(x, y))
+
+    def line_to(self, x, y):
+        self._line(self._device(x, y))
+
+    def rel_line_to(self, dx, dy):
+        assert(self._current is not None)
+        self._line((self._current[0] + dx, self._current[1] + dy))
+
+    def _arc(self, xc, yc, radius, angle1, angle2):
+        cx, cy = self._device(xc, yc)
+        start = (cx + radius * math.cos(angle1), cy + radius * math.sin(angle1))
+        if self._current is None:
+            self._move(start)
+        elif math.hypot(start[0] - self._current[0], start[1] - self._current[1]) > POINT_EPSILON:
+            self._line(start)
+        self._path.append(("A", cx, cy, radius, angle1, angle2))
+        self._current = (cx + radius * math.cos(angle2), cy + radius * math.sin(angle2))
+
+    def arc(self, xc, yc, radius, angle1, angle2):
+        while angle2 < angle1:
+            angle2 += 2.0 * math.pi
+        self._arc(xc, yc, radius, angle1, angle2)
+
+    def arc_negative(self, xc, yc, radius, angle1, angle2):
+        while angle2 > angle1:
+            angle2 -= 2.0 * math.pi
+        self._arc(xc, yc, radius, angle1, angle2)
+
+    def close_path(self):
+        if self._current is None:
+            return
+        self._path.append(("Z",))
+        self._current = self._subpath_start
+
+    def new_path(self):
+        self._path = []
+        self._current = None
+        self._subpath_start = None
+
+    def stroke(self):
+        if self._path:
+            self.strokes.append(Stroke(self._style, tuple(self._path)))
+        self.new_path()
+
+def replay(strokes, context):
+    """
+    Draw recorded strokes onto a real cairo.Context (or another recorder).
+    """
+    context.identity_matrix()
+    for stroke in strokes:
+        width, color, dash = stroke.style
+        context.set_line_width(width)
+        context.set_source_rgba(*color)
+        context.set_dash(dash)
+        for op in stroke.ops:
+            if op[0] == "M":
+                context.move_to(op[1], op[2])
+            elif op[0] == "L":
+                context.line_to(op[1], op[2])
+            elif op[0] == "A":
+                if op[5] < op[4]:
+                    context.arc_negative(*op[1:])
+                else:
+                    context.arc(*op[1:])
+            elif op[0] == "Z":
+                context.close_path()
+        context.stroke()
+
+def arc_point(center, radius, angle):
+    return (center[0] + radius * math.cos(angle), center[1] + radius * math.sin(angle))
+
+def segment_start(segment):
+    if segment[0] == "L":
+        return segment[1]
+    return arc_point(segment[1], segment[2], segment[3])
+
+def segment_end(segment):
+    if segment[0] == "L":
+        return segment[2]
+    return arc_point(segment[1], segment[2], segment[4])
+
+def _coincident(p, q):
+    return math.hypot(p[0] - q[0], p[1] - q[1]) <= POINT_EPSILON
+
+def subpaths(ops):
+    """
+    Split recorded path operations into sub paths. Yields (ops, segments,
+    closed) where segments are ["L", p0, p1] or ["A", center, radius, a1, a2]
+    and zero length lines are dropped. A sub path ending where it started
+    (e.g. a full circle) counts as closed.
+    """
+    subpath_ops = []
+    segments = []
+    closed = False
+    current = None
+    start = None
+    for op in ops:
+        if op[0] == "M" or (closed and op[0] != "Z"):
+            if subpath_ops:
+                yield subpath_ops, segments, closed or _coincident(current, start)
+            if op[0] != "M":
+                # drawing on after close_path starts from the closed point
+                subpath_ops = [("M",) + start]
+            else:
+                subpath_ops = []
+                start = current = (op[1], op[2])
+            segments = []
+            closed = False
+        subpath_ops.append(op)
+        if op[0] == "L":
+            point = (op[1], op[2])
+            if not _coincident(current, point):
+                segments.append(["L", current, point])
+            current = point
+        elif op[0] == "A":
+            segment = ["A", (op[1], op[2]), op[3], op[4], op[5]]
+            if not _coincident(current, segment_start(segment)):
+                segments.append(["L", current, segment_start(segment)])
+            segments.append(segment)
+            current = segment_end(segment)
+        elif op[0] == "Z":
+            if not _coincident(current, start):
+                segments.append(["L", current, start])
+            current = start
+            closed = True
+    if subpath_ops:
+        yield subpath_ops, segments, closed or _coincident(current, start)
@@ -0,0 +1,674 @@
+"""
+Golden geometry and timing harness for the chassis design.
+
+Every configuration in CONFIGURATIONS is rendered into a RecordingContext and
+the recorded path operations are compared against the dumps stored in
+designs/golden, within a numeric tolerance. The time taken to render each
+configuration is reported against the stored baseline timings.
+
+The sketch interpreter behind the simulator is checked the same way: the
+drawing functions of ExampleDrawings.ino must produce their golden command
+lists and the small programs in SKETCH_CASES pin down its C semantics.
+The GeometryStore must round trip recordings through its file format,
+memory maps and pickles, arc flattening must stay within its tolerance with
+the fewest chords, and the SVG compiler is checked for path data parsing,
+stroke ordering and compiled drawings that, run through the simulator, stay
+within tolerance.
+
+    python -m designs.regression            # compare against the baselines
+    python -m designs.regression --update   # rewrite the baselines
+"""
+from __future__ import print_function
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import sys
+import timeit
+from collections import namedtuple
+
+import numpy as np
+
+from . import chassis, compiler, flatten
+from .geometry import ARRAYS, LINE, GeometryStore
+from .kerf import compensate
+from .recording import RecordingContext
+from .simulator import DEFAULT_ROBOT, simulate
+from .sketch import Command, Sketch, SketchError
+
+GOLDEN_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+TIMINGS_FILE = os.path.join(GOLDEN_DIRECTORY, "timings.json")
+DEFAULT_TOLERANCE = 1e-6 # points
+DUMP_DIGITS = 9
+DEFAULT_REPEAT = 5
+
+EXAMPLE_SKETCH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    os.pardir, os.pardir, "ExampleDrawings", "ExampleDrawings.ino")
+EXAMPLE_FUNCTIONS = ("drawPentagon", "drawSpiral", "drawSquiggle", "drawPicture")
+SKETCH_GOLDEN_FILE = os.path.join(GOLDEN_DIRECTORY, "sketches.json")
+
+# (name, source, commands drawPicture() must produce), None for a SketchError
+SKETCH_CASES = (
+    ("integer division truncates towards zero",
+        "void drawPicture() { wait(-7 / 2 + 10); wait(7 / -2 + 10); wait(7 / 2); }",
+        [("wait", (7,)), ("wait", (7,)), ("wait", (3,))]),
+    ("remainder takes the sign of the dividend",
+        "void drawPicture() { wait(-7 % 3 + 10); wait(7 % -3 + 10); }",
+        [("wait", (9,)), ("wait", (11,))]),
+    ("float division",
+        "void drawPicture() { float x = 7 / 2.0; wait(x * 10); wait(7.0 / 2 * 10); }",
+        [("wait", (35,)), ("wait", (35,))]),
+    ("int variables truncate",
+        "void drawPicture() { int x = 3.9; wait(x); x = -3.9; wait(x + 10); }",
+        [("wait", (3,)), ("wait", (7,))]),
+    ("casts",
+        "void drawPicture() { wait((int)(2.7) * 10); wait((float)7 / 2 * 10); }",
+        [("wait", (20,)), ("wait", (35,))]),
+    ("bool variables",
+        "void drawPicture() { bool b = 5; wait(b + 1); b = 0.0; wait(b + 1); }",
+        [("wait", (2,)), ("wait", (1,))]),
+    ("compound assignment and increments",
+        "void drawPicture() { int i = 5; i += 2; i *= 3; wait(i); wait(i++); wait(++i); i /= 2; wait(i); }",
+        [("wait", (21,)), ("wait", (21,)), ("wait", (23,)), ("wait", (11,))]),
+    ("block scopes",
+        "void drawPicture() { int x = 1; { int x = 2; wait(x); } wait(x); }",
+        [("wait", (2,)), ("wait", (1,))]),
+    ("break and continue",
+        "void drawPicture() { for (int i = 0; i < 10; i++) { if (i == 1) continue; if (i == 4) break; wait(i); } }",
+        [("wait", (0,)), ("wait", (2,)), ("wait", (3,))]),
+    ("while and do while",
+        "void drawPicture() { int i = 3; do { wait(i); i--; } while (i > 5); while (i > 0) wait(i--); }",
+        [("wait", (3,)), ("wait", (2,)), ("wait", (1,))]),
+    ("return values convert to the function type",
+        "int half(float x) { return x / 2; } void drawPicture() { wait(half(7)); }",
+        [("wait", (3,))]),
+    ("globals",
+        "int count = 2; void step() { count = count + 1; } void drawPicture() { step(); step(); wait(count); }",
+        [("wait", (4,))]),
+    ("logic and conditional expressions",
+        "void drawPicture() { wait(3 > 2 && 0 || 1 ? 10 : 20); wait(!5 + 1); }",
+        [("wait", (10,)), ("wait", (1,))]),
+    ("drawing API arguments are truncated and clamped",
+        "void drawPicture() { driveForward(25.9, -5); turnLeft(12.7); turnRight(3); penDown(); penUp(); }",
+        [("drive", (25, 0)), ("left", (12,)), ("right", (3,)), ("pen", (True,)), ("pen", (False,))]),
+    ("float division by zero",
+        "void drawPicture() { float x = 0.0; if (1 / x > 1000000) penDown(); if (0 / x != 0 / x) penUp(); }",
+        [("pen", (True,)), ("pen", (False,))]),
+    ("math domain errors give nan",
+        "void drawPicture() { float y = sqrt(-1); if (y != y) penDown(); }",
+        [("pen", (True,))]),
+    ("object and reference parameters are skipped",
+        "void say(String s) {} void aim(Servo &m) {} void drawPicture() { wait(1); }",
+        [("wait", (1,))]),
+    ("calling a function with an unsupported parameter",
+        "void poly(int pts[], int n) {} void drawPicture() { poly(1, 2); }",
+        None),
+    ("unnamed prototype parameters",
+        "void f(int); void f(int n) { wait(n); } void drawPicture() { f(3); }",
+        [("wait", (3,))]),
+    ("void and qualified parameters",
+        "void g(void) { wait(4); } void h(const int a, float b) { wait(a + b); } void drawPicture() { g(); h(1, 2.5); }",
+        [("wait", (4,)), ("wait", (3,))]),
+    ("unterminated parameter list",
+        "void drawPicture( { wait(1); }",
+        None),
+    ("integer division by zero",
+        "void drawPicture() { int x = 1 / 0; }",
+        None),
+    ("runaway recursion",
+        "int f(int n) { return f(n + 1); } void drawPicture() { f(0); }",
+        None),
+)
+
+# Fixed cut line styles, so the baselines do not depend on the FOR_LASER_CUTTER
+# switch in chassis.py
+PREVIEW_CUT_LINE_STYLE = chassis.LineStyle(
+    width = 0.1 * chassis.units.mm,
+    color = (1.0, 0.0, 0.0, 1.0),
+    dash = None
+)
+LASER_CUT_LINE_STYLE = PREVIEW_CUT_LINE_STYLE._replace(width = 0.01 * chassis.units.mm)
+
+Configuration = namedtuple("Configuration", "name for_laser_cutter tesselation mounting_hole kerf")
+
+CONFIGURATIONS = tuple(
+    Configuration(
+        name = "%s-%s-%s" % (
+            "laser" if for_laser_cutter else "preview",
+            "tesselated" if tesselation else "single",
+            hole_name
+        ),
+        for_laser_cutter = for_laser_cutter,
+        tesselation = tesselation,
+        mounting_hole = hole,
+        kerf = None
+    )
+    for for_laser_cutter in (False, True)
+    for tesselation in (False, True)
+    for (hole_name, hole) in (("m3", chassis.M3_MOUNTING_HOLE), ("m2", chassis.M2_MOUNTING_HOLE))
+) + tuple(
+    Configuration(
+        name = "laser-%s-m3-kerf" % ("tesselated" if tesselation else "single"),
+        for_laser_cutter = True,
+        tesselation = tesselation,
+        mounting_hole = chassis.M3_MOUNTING_HOLE,
+        kerf = chassis.LASER_KERF
+    )
+    for tesselation in (False, True)
+)
+
+@contextlib.contextmanager
+def configured(config):
+    """
+    Temporarily apply a configuration to the chassis module globals, the same
+    way the FOR_LASER_CUTTER switch at the top of chassis.py does. The
+    mounting hole is used everywhere M3_MOUNTING_HOLE is; for other holes
+    than M3 the servo mount and sheet layout derived from its nut width are
+    recomputed to match.
+    """
+    hole = config.mounting_hole
+    settings = {
+        "MOUNTING_HOLE_GUIDES": not config.for_laser_cutter,
+        "BOARD_OUTLINE": not config.for_laser_cutter,
+        "MAJOR_GRID": not config.for_laser_cutter,
+        "MINOR_GRID": not config.for_laser_cutter,
+        "CUT_LINE_STYLE": LASER_CUT_LINE_STYLE if config.for_laser_cutter else PREVIEW_CUT_LINE_STYLE,
+        "M3_MOUNTING_HOLE": hole,
+        "BATTERY_MOUNTING_HOLE": hole._replace(nut_width=None, nut_height=None),
+    }
+    if hole != chassis.M3_MOUNTING_HOLE:
+        # shift by the difference only, so edits to the constants still show
+        change = chassis.servo_mount_breadth(hole) - chassis.servo_mount_breadth(chassis.M3_MOUNTING_HOLE)
+        settings["SERVO_MOUNT_BREADTH"] = chassis.SERVO_MOUNT_BREADTH + change
+        settings["TESSELATION_OFFSET_Y"] = chassis.TESSELATION_OFFSET_Y + change
+    saved = dict((key, getattr(chassis, key)) for key in settings)
+    try:
+        for key, value in settings.items():
+            setattr(chassis, key, value)
+        yield
+    finally:
+        for key, value in saved.items():
+            setattr(chassis, key, value)
+
+def record(config):
+    context = RecordingContext()
+    with configured(config):
+        if config.tesselation:
+            chassis.render_sheet(context, chassis.TESSELATION_COUNT_H, chassis.TESSELATION_COUNT_V)
+        else:
+            chassis.render_sheet(context, 1, 1)
+    if config.kerf is not None:
+        return compensate(context.strokes, chassis.PTS(config.kerf), LASER_CUT_LINE_STYLE.color)
+    return context.strokes
+
+def dump(strokes):
+    """
+    Canonical, backend independent form of recorded strokes (plain lists and
+    floats, so it round trips through JSON unchanged). Coordinates are
+    rounded to DUMP_DIGITS decimals, well below DEFAULT_TOLERANCE.
+    """
+    return [
+        {
+            "style": [width, list(color), list(dash)],
+            "ops": [[op[0]] + [round(float(v), DUMP_DIGITS) for v in op[1:]] for op in ops]
+        }
+        for ((width, color, dash), ops) in strokes
+    ]
+
+def _compare_values(expected, actual, tolerance, where):
+    if isinstance(expected, list):
+        if not isinstance(actual, list) or len(expected) != len(actual):
+            return "%s: expected %r, got %r" % (where, expected, actual)
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            mismatch = _compare_values(e, a, tolerance, "%s[%d]" % (where, i))
+            if mismatch:
+                return mismatch
+    elif isinstance(expected, float):
+        if isinstance(actual, bool) or not isinstance(actual, (int, float)) or abs(expected - actual) > tolerance:
+            return "%s: expected %r, got %r" % (where, expected, actual)
+    elif expected != actual:
+        return "%s: expected %r, got %r" % (where, expected, actual)
+    return None
+
+def compare(expected, actual, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare two dumps. Returns None when they match within `tolerance`,
+    otherwise a description of the first mismatch.
+    """
+    if len(expected) != len(actual):
+        return "expected %d strokes, got %d" % (len(expected), len(actual))
+    for i, (e, a) in enumerate(zip(expected, actual)):
+        for key in ("style", "ops"):
+            mismatch = _compare_values(e[key], a[key], tolerance, "stroke[%d].%s" % (i, key))
+            if mismatch:
+                return mismatch
+    return None
+
+def time_render(config, repeat=DEFAULT_REPEAT):
+    """
+    Best wall clock time (in seconds) of `repeat` recordings of `config`.
+    """
+    return min(timeit.repeat(lambda: record(config), repeat=repeat, number=1))
+
+def golden_path(config):
+    return os.path.join(GOLDEN_DIRECTORY, config.name + ".json")
+
+def load_golden(config):
+    with open(golden_path(config)) as f:
+        return json.load(f)
+
+def save_golden(config, strokes):
+    if not os.path.isdir(GOLDEN_DIRECTORY):
+        os.makedirs(GOLDEN_DIRECTORY)
+    # one stroke per line keeps diffs of the golden files readable
+    with open(golden_path(config), "w") as f:
+        f.write("[\n")
+        f.write(",\n".join(json.dumps(stroke, sort_keys=True) for stroke in dump(strokes)))
+        f.write("\n]\n")
+
+def _commands(commands):
+    # plain lists, as stored in the golden file
+    return [[name] + list(args) for (name, args) in commands]
+
+def record_sketches():
+    sketch = Sketch.from_file(EXAMPLE_SKETCH)
+    return dict((function, _commands(sketch.run(function))) for function in EXAMPLE_FUNCTIONS)
+
+def check_sketch_case(source, expected):
+    """
+    Run a SKETCH_CASES program. Returns None when it behaves as expected,
+    otherwise a description of the difference.
+    """
+    try:
+        commands = Sketch(source).run()
+    except SketchError as e:
+        return None if expected is None else "unexpected error: %s" % e
+    if expected is None:
+        return "expected an error, got %r" % (commands,)
+    expected = [Command(name, args) for (name, args) in expected]
+    if list(commands) != expected:
+        return "expected %r, got %r" % (expected, list(commands))
+    return None
+
+def load_sketch_goldens():
+    with open(SKETCH_GOLDEN_FILE) as f:
+        return json.load(f)
+
+def save_sketch_goldens(goldens):
+    with open(SKETCH_GOLDEN_FILE, "w") as f:
+        f.write("{\n")
+        f.write(",\n".join(
+            "%s: %s" % (json.dumps(function), json.dumps(goldens[function]))
+            for function in sorted(goldens)
+        ))
+        f.write("\n}\n")
+
+def check_sketches(update=False):
+    """
+    Compare the example drawings against their golden command lists and run
+    SKETCH_CASES. Returns a list of (name, status, mismatch) rows.
+    """
+    rows = []
+    sketches = record_sketches()
+    if update:
+        save_sketch_goldens(sketches)
+    goldens = load_sketch_goldens() if os.path.exists(SKETCH_GOLDEN_FILE) else {}
+    for function in EXAMPLE_FUNCTIONS:
+        if update:
+            rows.append((function, "updated", None))
+        elif function not in goldens:
+            rows.append((function, "missing", None))
+        else:
+            mismatch = _compare_values(goldens[function], sketches[function], 0.0, function)
+            rows.append((function, "ok" if mismatch is None else "CHANGED", mismatch))
+    for (name, source, expected) in SKETCH_CASES:
+        mismatch = check_sketch_case(source, expected)
+        rows.append((name, "ok" if mismatch is None else "FAILED", mismatch))
+    return rows
+
+# the recording the GeometryStore and arc flattening checks run on
+STORE_CONFIGURATION = "laser-tesselated-m3"
+
+def _same_arrays(a, b):
+    return all(np.array_equal(getattr(a, name), getattr(b, name)) for (name, dtype, shape) in ARRAYS) \
+        and a.styles == b.styles
+
+def check_store(strokes, directory):
+    """
+    GeometryStore checks on a recording. Returns a list of (name, mismatch)
+    pairs, mismatch None when the check passed.
+    """
+    checks = []
+    store = GeometryStore.from_strokes(strokes)
+    path = os.path.join(directory, "store.geom")
+    store.save(path)
+    mapped = GeometryStore.load(path)
+    checks.append(("save, load and to_strokes round trip",
+        compare(dump(strokes), dump(mapped.to_strokes()))))
+    checks.append(("copied load matches", None if _same_arrays(store, GeometryStore.load(path, mmap=False))
+        else "arrays differ"))
+    writeable = [name for (name, dtype, shape) in ARRAYS if getattr(mapped, name).flags.writeable]
+    checks.append(("mapped arrays are read-only",
+        "writeable: %s" % ", ".join(writeable) if writeable else None))
+    pickled = pickle.dumps(mapped)
+    reduced = mapped.__reduce__()
+    if reduced != (GeometryStore.load, (path,)) or len(pickled) > len(path) + 200:
+        mismatch = "a mapped store pickles to %d bytes" % len(pickled)
+    elif not _same_arrays(store, pickle.loads(pickled)):
+        mismatch = "unpickled arrays differ"
+    else:
+        mismatch = None
+    checks.append(("mapped stores pickle as their path", mismatch))
+    copied = pickle.loads(pickle.dumps(store))
+    checks.append(("in-memory stores pickle their arrays",
+        None if _same_arrays(store, copied) else "unpickled arrays differ"))
+
+    # a second store with other styles, so the style tables get merged
+    other = GeometryStore.from_strokes(record(
+        [c for c in CONFIGURATIONS if c.name == "preview-single-m2"][0]))
+    shifted = other.translated(500.0, -20.0)
+    joined = GeometryStore.concatenate([GeometryStore.empty(), store, GeometryStore.empty(), shifted])
+    expected = dump(store.to_strokes()) + dump(shifted.to_strokes())
+    mismatch = compare(expected, dump(joined.to_strokes()))
+    if mismatch is None and len(joined) != len(store) + len(other):
+        mismatch = "expected %d contours, got %d" % (len(store) + len(other), len(joined))
+    if mismatch is None and len(joined.styles) != len(set(store.styles) | set(other.styles)):
+        mismatch = "style tables not merged"
+    checks.append(("concatenate with empty and translated stores", mismatch))
+    return checks
+
+def check_flattening(store, tolerance):
+    """
+    Flatten every arc of the store and check that every chord stays within
+    `tolerance`, that the polylines run through all segment end points and
+    that one chord less would break the tolerance. Returns a list of (name,
+    mismatch) pairs.
+    """
+    points, offsets = flatten.flatten_store(store, tolerance)
+    worst = 0.0
+    ends = minimal = None
+    for contour in store:
+        line = points[offsets[contour.index]:offsets[contour.index + 1]]
+        segments = contour.segments
+        if ends is None and not np.allclose(line[0], store.start[segments.start], rtol=0.0, atol=DEFAULT_TOLERANCE):
+            ends = "contour %d does not start at its first point" % contour.index
+        position = 1
+        for i in range(segments.start, segments.stop):
+            if store.kind[i] == LINE:
+                count = 1
+            else:
+                arc = store.arc[i]
+                radius = store.radius[arc]
+                sweep = store.angles[arc, 1] - store.angles[arc, 0]
+                count = int(flatten.segment_count(radius, sweep, tolerance))
+                chord = line[position - 1:position + count]
+                middle = 0.5 * (chord[1:] + chord[:-1])
+                worst = max(worst, float((radius - np.hypot(*(middle - store.center[arc]).T)).max()))
+                if minimal is None and count > 1 \
+                        and radius * (1.0 - np.cos(0.5 * abs(sweep) / (count - 1))) <= tolerance:
+                    minimal = "arc %d would fit the tolerance with %d chords" % (arc, count - 1)
+            if ends is None and not np.allclose(line[position + count - 1], store.end[i], rtol=0.0, atol=DEFAULT_TOLERANCE):
+                ends = "segment %d does not end at its end point" % i
+            position += count
+        if ends is None and position != len(line):
+            ends = "contour %d has %d points, expected %d" % (contour.index, len(line), position)
+    return [
+        ("chord error within %.4f pt (worst %.4f pt)" % (tolerance, worst),
+            None if worst <= tolerance * (1.0 + 1e-9) else "chord error %.6f pt" % worst),
+        ("polylines run through the segment end points", ends),
+        ("fewest chords", minimal),
+    ]
+
+def check_geometry():
+    """
+    GeometryStore and arc flattening checks on STORE_CONFIGURATION. Returns
+    a list of (name, status, mismatch) rows.
+    """
+    strokes = record([c for c in CONFIGURATIONS if c.name == STORE_CONFIGURATION][0])
+    directory = tempfile.mkdtemp()
+    try:
+        checks = check_store(strokes, directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    tolerance = flatten.FLATTEN_TOLERANCE.to(chassis.units.points).magnitude
+    checks.extend(check_flattening(GeometryStore.from_strokes(strokes), tolerance))
+    return [(name, "ok" if mismatch is None else "FAILED", mismatch) for (name, mismatch) in checks]
+
+CHASSIS_SVG = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "chassis.svg")
+CUT_LINE_COLOR = "rgb(100%,0%,0%)"
+# pen down arcs of the simulated trace are checked at this many points
+TRACE_SAMPLES = 16
+
+# (name, path data, expected [(start, [segments], closed), ...])
+PATH_CASES = (
+    ("relative, H/V, S and T commands",
+        "M10 10 h5 v5 H0 V0 l1 1 C 2 2 3 3 4 1 s 2 -2 3 0 Q 8 0 9 1 t 2 0",
+        [((10, 10), [
+            ("L", (15, 10)), ("L", (15, 15)), ("L", (0, 15)), ("L", (0, 0)), ("L", (1, 1)),
+            ("C", (2, 2), (3, 3), (4, 1)),
+            ("C", (5, -1), (6, -1), (7, 1)),
+            ("C", (7 + 2.0 / 3, 1 - 2.0 / 3), (9 - 2.0 / 3, 1 - 2.0 / 3), (9, 1)),
+            ("C", (9 + 2.0 / 3, 1 + 2.0 / 3), (11 - 2.0 / 3, 1 + 2.0 / 3), (11, 1)),
+        ], False)]),
+    ("S after Q and T after C start from the current point",
+        "M0 0 Q 1 1 2 0 S 3 1 4 0 M 0 0 C 0 1 1 1 1 0 T 2 0",
+        [((0, 0), [
+            ("C", (2.0 / 3, 2.0 / 3), (2 - 2.0 / 3, 2.0 / 3), (2, 0)),
+            ("C", (2, 0), (3, 1), (4, 0)),
+        ], False), ((0, 0), [
+            ("C", (0, 1), (1, 1), (1, 0)),
+            ("C", (1, 0), (2 - 2.0 / 3, 0), (2, 0)),
+        ], False)]),
+    ("close path",
+        "m 1 1 l 2 0 l 0 2 z",
+        [((1, 1), [("L", (3, 1)), ("L", (3, 3)), ("L", (1, 1))], True)]),
+)
+
+# curves, to compile through the whole pipeline
+CURVE_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="100mm" height="100mm" viewBox="0 0 100 100">'
+    '<g transform="translate(10,10) scale(0.8)">'
+    '<path style="stroke:rgb(0%,0%,0%)" d="M 10 50 C 10 10, 90 10, 90 50 S 10 90, 10 50 z'
+    ' m 20 0 q 20 -20 40 0 t 0 0 h 10 v 10 l -5 5"/>'
+    '</g></svg>'
+)
+
+def _path_numbers(subpaths):
+    numbers = []
+    for (start, segments, closed) in subpaths:
+        numbers.extend(start)
+        numbers.append(closed)
+        for segment in segments:
+            numbers.extend(coordinate for point in segment[1:] for coordinate in point)
+    return numbers
+
+def check_path_case(data, expected):
+    actual = compiler.parse_path(data)
+    kinds = [[s[0] for s in segments] for (_, segments, _) in actual]
+    expected_kinds = [[s[0] for s in segments] for (_, segments, _) in expected]
+    if kinds != expected_kinds:
+        return "expected segments %r, got %r" % (expected_kinds, kinds)
+    return _compare_values(
+        [float(v) for v in _path_numbers(expected)], [float(v) for v in _path_numbers(actual)], 1e-9, "path")
+
+def pen_down_points(trace):
+    """
+    Points along everything the pen draws in a simulated trace.
+    """
+    points = []
+    along = np.linspace(0.0, 1.0, TRACE_SAMPLES)
+    for i in np.nonzero(trace.pen)[0]:
+        if np.isinf(trace.radius[i]):
+            points.append(trace.pen_start[i] + along[:, np.newaxis] * (trace.pen_end[i] - trace.pen_start[i]))
+        else:
+            offset = trace.pen_start[i] - trace.center[i]
+            angle = np.arctan2(offset[1], offset[0]) + along * trace.sweep[i]
+            points.append(trace.center[i] + trace.radius[i] * np.column_stack((np.cos(angle), np.sin(angle))))
+    return np.vstack(points) if points else np.zeros((0, 2))
+
+def distance_to_polylines(points, polylines):
+    """
+    Distance from every point to the nearest segment of the polylines.
+    """
+    starts = np.vstack([line[:-1] for line in polylines])
+    vectors = np.vstack([line[1:] for line in polylines]) - starts
+    lengths = np.maximum((vectors * vectors).sum(axis=1), 1e-12)
+    nearest = np.full(len(points), np.inf)
+    for point_index, point in enumerate(points):
+        t = np.clip(((point - starts) * vectors).sum(axis=1) / lengths, 0.0, 1.0)
+        nearest[point_index] = np.hypot(*(point - starts - t[:, np.newaxis] * vectors).T).min()
+    return nearest
+
+def check_compiled(polylines, tolerance=compiler.DEFAULT_TOLERANCE):
+    """
+    Compile polylines, simulate the result and check that the pen draws
+    within `tolerance` of them and reaches all of their points.
+    """
+    commands = compiler.compile_polylines(polylines, DEFAULT_ROBOT, tolerance)
+    drawn = pen_down_points(simulate(commands))
+    if not len(drawn):
+        return "nothing drawn"
+    stray = distance_to_polylines(drawn, polylines).max()
+    if stray > tolerance:
+        return "the pen strays %.3f mm from the drawing" % stray
+    vertices = np.vstack(polylines)
+    missed = distance_to_polylines(vertices, [drawn]).max()
+    if missed > tolerance:
+        return "the pen misses a point by %.3f mm" % missed
+    return None
+
+def check_order(polylines):
+    origin = (0.0, -DEFAULT_ROBOT.pen_offset)
+    unordered = compiler.travel_distance(polylines, [(i, False) for i in range(len(polylines))], origin)
+    ordered = compiler.travel_distance(polylines, compiler.order_strokes(polylines, origin), origin)
+    if ordered > unordered + 1e-9:
+        return "ordered travel %.1f mm is longer than unordered %.1f mm" % (ordered, unordered)
+    return None
+
+def check_compiler():
+    """
+    Run the compiler checks. Returns a list of (name, status, mismatch) rows.
+    """
+    rows = []
+    for (name, data, expected) in PATH_CASES:
+        mismatch = check_path_case(data, expected)
+        rows.append((name, "ok" if mismatch is None else "FAILED", mismatch))
+
+    scale = (1.0 * chassis.units.points).to(chassis.units.mm).magnitude
+    cut_lines = compiler.place(compiler.flatten(compiler.read_svg(CHASSIS_SVG, CUT_LINE_COLOR), scale))
+    curves = compiler.place(compiler.flatten(compiler.read_svg(io.BytesIO(CURVE_SVG.encode("utf-8"))), scale))
+    # scattered short strokes, fixed seed
+    random = np.random.RandomState(26)
+    scattered = [start + np.array(((0.0, 0.0), step)) for (start, step)
+        in zip(random.uniform(0.0, 200.0, (300, 2)), random.uniform(-5.0, 5.0, (300, 2)))]
+    for (name, polylines) in (("chassis.svg cut lines", cut_lines), ("curves", curves), ("scattered strokes", scattered)):
+        mismatch = check_order(polylines)
+        rows.append(("stroke order of " + name, "ok" if mismatch is None else "FAILED", mismatch))
+    for (name, polylines) in (("chassis.svg cut lines", cut_lines), ("curves", curves)):
+        origin = (0.0, -DEFAULT_ROBOT.pen_offset)
+        ordered = [polylines[i][::-1] if r else polylines[i] for (i, r) in compiler.order_strokes(polylines, origin)]
+        mismatch = check_compiled(ordered)
+        rows.append(("compiled " + name, "ok" if mismatch is None else "FAILED", mismatch))
+    return rows
+
+def load_timings():
+    if not os.path.exists(TIMINGS_FILE):
+        return {}
+    with open(TIMINGS_FILE) as f:
+        return json.load(f)
+
+def save_timings(timings):
+    with open(TIMINGS_FILE, "w") as f:
+        json.dump(timings, f, indent=4, sort_keys=True)
+        f.write("\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--update", action="store_true",
+        help="rewrite the golden geometry and baseline timings")
+    parser.add_argument("--only", action="append", metavar="NAME",
+        help="only run the named configuration (may be repeated)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+        help="maximum coordinate difference in points (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+        help="timing runs per configuration, the best is kept (default: %(default)s)")
+    parser.add_argument("--max-slowdown", type=float, default=None, metavar="RATIO",
+        help="fail when a configuration is slower than RATIO times its baseline")
+    args = parser.parse_args(argv)
+
+    configs = [c for c in CONFIGURATIONS if not args.only or c.name in args.only]
+    unknown = set(args.only or ()) - set(c.name for c in configs)
+    if unknown:
+        parser.error("unknown configuration(s): %s" % ", ".join(sorted(unknown)))
+
+    timings = load_timings()
+    failed = False
+    print("%-26s %-8s %10s %10s %8s" % ("configuration", "geometry", "time (ms)", "base (ms)", "speedup"))
+    for config in configs:
+        strokes = record(config)
+        elapsed = time_render(config, args.repeat)
+        baseline = timings.get(config.name)
+        if args.update:
+            save_golden(config, strokes)
+            timings[config.name] = elapsed
+            status = "updated"
+        elif not os.path.exists(golden_path(config)):
+            status = "missing"
+            failed = True
+        else:
+            mismatch = compare(load_golden(config), dump(strokes), args.tolerance)
+            status = "ok" if mismatch is None else "CHANGED"
+            if mismatch is not None:
+                failed = True
+        print("%-26s %-8s %10.2f %10s %8s" % (
+            config.name,
+            status,
+            1000.0 * elapsed,
+            "-" if baseline is None else "%.2f" % (1000.0 * baseline),
+            "-" if baseline is None else "%.2fx" % (baseline / elapsed)
+        ))
+        if status == "CHANGED":
+            print("    " + mismatch)
+        if (not args.update and baseline is not None and args.max_slowdown is not None
+                and elapsed > args.max_slowdown * baseline):
+            print("    slower than %.2fx the baseline" % args.max_slowdown)
+            failed = True
+    if args.update:
+        save_timings(timings)
+
+    if not args.only:
+        print()
+        print("%-54s %s" % ("sketch interpreter", "commands"))
+        for (name, status, mismatch) in check_sketches(args.update):
+            print("%-54s %s" % (name, status))
+            if mismatch:
+                print("    " + mismatch)
+            if status not in ("ok", "updated"):
+                failed = True
+
+        print()
+        print("%-54s %s" % ("geometry store and arc flattening", "result"))
+        for (name, status, mismatch) in check_geometry():
+            print("%-54s %s" % (name, status))
+            if mismatch:
+                print("    " + mismatch)
+            if status != "ok":
+                failed = True
+
+        print()
+        print("%-54s %s" % ("svg compiler", "result"))
+        for (name, status, mismatch) in check_compiler():
+            print("%-54s %s" % (name, status))
+            if mismatch:
+                print("    " + mismatch)
+            if status != "ok":
+                failed = True
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
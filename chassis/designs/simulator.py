@@ -0,0 +1,277 @@
+"""
+Preview what a workshop sketch draws without running the robot.
+
+The drawing API calls of a sketch (see designs/sketch.py) are turned into
+segments of constant wheel speeds, integrated in closed form with numpy and
+the pen trace is rendered as lines and arcs through the cairo pipeline:
+
+    python -m designs.simulator ../ExampleDrawings/ExampleDrawings.ino --function drawPentagon
+
+The robot geometry comes from the chassis design. SERVO_MOUNT_CENTER_OFFSET
+only places the servo mounts either side of the marker to keep it on the
+center line; how far ahead of the axle the pen sits follows from the motor
+mount dimensions, which is why PEN_OFFSET is derived from those.
+
+The motor speed model is a linear approximation calibrated so that
+turnRight(450) turns the pentagon of ExampleDrawings by about 72 degrees;
+measure your own robot and adjust WHEEL_SPEED_AT_FULL_POWER if previews and
+drawings disagree.
+"""
+from __future__ import print_function
+
+import argparse
+import math
+import os
+import sys
+from collections import namedtuple
+
+import cairo
+import numpy as np
+
+from . import chassis
+from .chassis import LineStyle, units
+from .recording import Stroke, replay
+from .sketch import Sketch, SketchError
+
+# wheel surface speed with the motor shield speed set to 255
+WHEEL_SPEED_AT_FULL_POWER = 490.0 * units.mm / units.second
+# motor shield speed set by turnLeft() and turnRight()
+TURN_MOTOR_SPEED = 100
+
+# the wheels sit on the long sides of the chassis and the marker is held
+# between the servo mounts, just ahead of the front edge of the chassis
+WHEELBASE = chassis.CHASSIS_BASIC_WIDTH
+AXLE_TO_FRONT_EDGE = (chassis.MOTOR_MOUNTING_EDGE_CLEARANCE
+    + 0.5 * chassis.M3_MOUNTING_HOLE.hole_diameter
+    + 0.5 * chassis.MOTOR_MOUNTING_BREADTH)
+PEN_OFFSET = AXLE_TO_FRONT_EDGE + 0.5 * chassis.MARKER_WIDTH
+
+PEN_STYLE = LineStyle(
+    width = 1.0 * units.mm,
+    color = (0.0, 0.0, 0.0, 1.0),
+    dash = None
+)
+TRAVEL_STYLE = LineStyle(
+    width = 0.25 * units.mm,
+    color = (0.0, 0.5, 1.0, 0.5),
+    dash = (2.0 * units.mm, 1.0 * units.mm)
+)
+PREVIEW_MARGIN = 10.0 * units.mm
+
+# wheelbase and pen offset in mm, wheel speed in mm per second
+Robot = namedtuple("Robot", "wheelbase pen_offset wheel_speed turn_speed")
+
+DEFAULT_ROBOT = Robot(
+    wheelbase = WHEELBASE.to(units.mm).magnitude,
+    pen_offset = PEN_OFFSET.to(units.mm).magnitude,
+    wheel_speed = WHEEL_SPEED_AT_FULL_POWER.to(units.mm / units.second).magnitude,
+    turn_speed = TURN_MOTOR_SPEED
+)
+
+# Result of a simulation, one entry per command segment (all in mm, radians
+# and seconds). Poses are those at the start of each segment, pen_start and
+# pen_end the pen positions and center/radius/sweep describe the arc the pen
+# follows (radius is inf for straight segments).
+Trace = namedtuple("Trace", "duration pen x y heading pen_start pen_end center radius sweep")
+
+def segments(commands, robot=DEFAULT_ROBOT):
+    """
+    Wheel speeds (mm/s), durations (s) and pen state of every command.
+    Mirrors the sketch API: driveForward runs both motors at
+    speed_pct * 255 / 100, turnLeft/turnRight one motor at TURN_MOTOR_SPEED.
+    """
+    count = len(commands)
+    left = np.zeros(count)
+    right = np.zeros(count)
+    duration = np.zeros(count)
+    pen = np.zeros(count, dtype=bool)
+    down = False
+    scale = robot.wheel_speed / 255.0
+    for (i, (name, args)) in enumerate(commands):
+        if name == "drive":
+            speed = int(args[0] * (255.0 / 100.0)) * scale
+            left[i] = right[i] = speed
+            duration[i] = args[1]
+        elif name == "left":
+            right[i] = robot.turn_speed * scale
+            duration[i] = args[0]
+        elif name == "right":
+            left[i] = robot.turn_speed * scale
+            duration[i] = args[0]
+        elif name == "wait":
+            duration[i] = args[0]
+        elif name == "pen":
+            down = bool(args[0])
+        pen[i] = down
+    return left, right, 0.001 * duration, pen
+
+def simulate(commands, robot=DEFAULT_ROBOT, heading=-0.5 * math.pi, position=(0.0, 0.0)):
+    """
+    Integrate a command list. The robot starts with its axle center at
+    `position`, facing `heading` (default up the page, in y-down page
+    coordinates).
+    """
+    left, right, duration, pen = segments(commands, robot)
+    v = 0.5 * (left + right)
+    omega = (left - right) / robot.wheelbase
+    sweep = omega * duration
+    heading_end = heading + np.cumsum(sweep)
+    heading_start = heading_end - sweep
+    turning = np.abs(omega) > 1e-12
+    # v / omega: signed distance from the axle center to the center of rotation
+    lever = np.where(turning, v / np.where(turning, omega, 1.0), 0.0)
+    cos0, sin0 = np.cos(heading_start), np.sin(heading_start)
+    cos1, sin1 = np.cos(heading_end), np.sin(heading_end)
+    dx = np.where(turning, lever * (sin1 - sin0), v * duration * cos0)
+    dy = np.where(turning, lever * (cos0 - cos1), v * duration * sin0)
+    x = position[0] + np.concatenate(([0.0], np.cumsum(dx)))
+    y = position[1] + np.concatenate(([0.0], np.cumsum(dy)))
+    pen_x = x + robot.pen_offset * np.cos(np.concatenate(([heading], heading_end)))
+    pen_y = y + robot.pen_offset * np.sin(np.concatenate(([heading], heading_end)))
+    pen_start = np.column_stack((pen_x[:-1], pen_y[:-1]))
+    pen_end = np.column_stack((pen_x[1:], pen_y[1:]))
+    center = np.column_stack((x[:-1] - lever * sin0, y[:-1] + lever * cos0))
+    radius = np.where(turning, np.hypot(pen_start[:, 0] - center[:, 0], pen_start[:, 1] - center[:, 1]), np.inf)
+    return Trace(duration, pen, x[:-1], y[:-1], heading_start, pen_start, pen_end, center, radius, sweep)
+
+def drawing_time(commands, robot=DEFAULT_ROBOT):
+    """
+    Seconds the robot takes to run the commands.
+    """
+    return float(segments(commands, robot)[2].sum())
+
+def segment_lengths(trace):
+    """
+    Length (mm) of the path the pen follows during every segment.
+    """
+    straight = np.isinf(trace.radius)
+    chord = np.hypot(*(trace.pen_end - trace.pen_start).T)
+    return np.where(straight, chord, np.where(straight, 0.0, trace.radius) * np.abs(trace.sweep))
+
+def _moving(trace):
+    return (np.hypot(*(trace.pen_end - trace.pen_start).T) > 1e-9) | (np.abs(trace.sweep) > 1e-12)
+
+def pen_strokes(trace, moving_only=True):
+    """
+    Split a trace into runs of pen down segments. Yields (pen down, first,
+    last) index ranges (last exclusive); segments without motion are skipped
+    when `moving_only` is set.
+    """
+    moving = _moving(trace)
+    first = None
+    for i in range(len(trace.duration)):
+        if moving_only and not moving[i]:
+            continue
+        if first is None:
+            first, down = i, trace.pen[i]
+        elif trace.pen[i] != down:
+            yield down, first, i
+            first, down = i, trace.pen[i]
+    if first is not None:
+        yield down, first, len(trace.duration)
+
+POINTS_PER_MM = (1.0 * units.mm).to(units.points).magnitude
+
+def _style(style):
+    return (
+        style.width.to(units.points).magnitude,
+        style.color,
+        tuple() if style.dash is None else tuple(d.to(units.points).magnitude for d in style.dash)
+    )
+
+def trace_strokes(trace, travel=True):
+    """
+    Recorded strokes (in points, page coordinates) of the pen trace, with
+    pen up travel drawn in TRAVEL_STYLE when `travel` is set.
+    """
+    pen_style = _style(PEN_STYLE)
+    travel_style = _style(TRAVEL_STYLE)
+    start = (POINTS_PER_MM * trace.pen_start).tolist()
+    end = (POINTS_PER_MM * trace.pen_end).tolist()
+    center = (POINTS_PER_MM * trace.center).tolist()
+    radius = (POINTS_PER_MM * trace.radius).tolist()
+    angle = np.arctan2(trace.pen_start[:, 1] - trace.center[:, 1], trace.pen_start[:, 0] - trace.center[:, 0]).tolist()
+    sweep = trace.sweep.tolist()
+    moving = _moving(trace).tolist()
+    strokes = []
+    for (down, first, last) in pen_strokes(trace):
+        if not down and not travel:
+            continue
+        ops = [("M",) + tuple(start[first])]
+        for i in range(first, last):
+            if not moving[i]:
+                continue
+            if math.isinf(radius[i]):
+                ops.append(("L",) + tuple(end[i]))
+            else:
+                ops.append(("A",) + tuple(center[i]) + (radius[i], angle[i], angle[i] + sweep[i]))
+        strokes.append(Stroke(pen_style if down else travel_style, tuple(ops)))
+    return strokes
+
+def _bounds(strokes):
+    xs, ys = [], []
+    for stroke in strokes:
+        for op in stroke.ops:
+            if op[0] in ("M", "L"):
+                xs.append(op[1])
+                ys.append(op[2])
+            elif op[0] == "A":
+                xs.extend((op[1] - op[3], op[1] + op[3]))
+                ys.extend((op[2] - op[3], op[2] + op[3]))
+    if not xs:
+        return (0.0, 0.0, 0.0, 0.0)
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def render_preview(trace, path, travel=True):
+    """
+    Write the pen trace to an SVG file sized to fit the drawing.
+    """
+    strokes = trace_strokes(trace, travel)
+    margin = PREVIEW_MARGIN.to(units.points).magnitude
+    left, top, right, bottom = _bounds(strokes)
+    with cairo.SVGSurface(path, right - left + 2 * margin, bottom - top + 2 * margin) as surface:
+        context = cairo.Context(surface)
+        shifted = []
+        for stroke in strokes:
+            ops = []
+            for op in stroke.ops:
+                if op[0] in ("M", "L", "A"):
+                    op = (op[0], op[1] - left + margin, op[2] - top + margin) + op[3:]
+                ops.append(op)
+            shifted.append(Stroke(stroke.style, tuple(ops)))
+        replay(shifted, context)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Preview the drawings of workshop sketches.")
+    parser.add_argument("sketches", nargs="+", metavar="SKETCH", help=".ino files to simulate")
+    parser.add_argument("--function", default="drawPicture",
+        help="function of the sketch to run (default: %(default)s)")
+    parser.add_argument("--output-dir", default=".",
+        help="directory for the SVG previews (default: current directory)")
+    parser.add_argument("--no-travel", action="store_true", help="do not draw pen up travel")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for path in args.sketches:
+        name = os.path.splitext(os.path.basename(path))[0]
+        output = os.path.join(args.output_dir, "%s.%s.svg" % (name, args.function))
+        try:
+            commands = Sketch.from_file(path).run(args.function)
+            trace = simulate(commands)
+            render_preview(trace, output, travel=not args.no_travel)
+        except SketchError as e:
+            print("%s: %s" % (path, e))
+            failed = True
+            continue
+        except Exception as e:
+            # one broken sketch must not stop the previews of the others
+            print("%s: failed (%s: %s)" % (path, type(e).__name__, e))
+            failed = True
+            continue
+        drawn = float(segment_lengths(trace)[trace.pen].sum())
+        print("%s: %d commands, %.1f s, %.0f mm drawn -> %s" % (
+            path, len(commands), drawing_time(commands), drawn, output))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,689 @@
+"""
+Interpreter for the drawing part of the workshop Arduino sketches.
+
+Only the subset of C that students use inside drawPicture() and its helpers
+is understood: int/float/bool variables, arithmetic, if/else, for, while and
+do/while loops and calls to other functions of the sketch. The hardware
+facing functions of the drawing API (driveForward, turnLeft, turnRight,
+penDown, penUp, wait) are not interpreted from the sketch; calling them
+records a Command instead, so the sketch's own definitions are ignored.
+"""
+import math
+import re
+from collections import namedtuple
+
+# one call of the drawing API, times are in milliseconds
+#   ("drive", speed_pct, time_ms)
+#   ("left", time_ms)
+#   ("right", time_ms)
+#   ("pen", down)
+#   ("wait", time_ms)
+Command = namedtuple("Command", "name args")
+
+# guards against programs that never finish
+MAX_STEPS = 1000000
+MAX_COMMANDS = 100000
+MAX_CALL_DEPTH = 100
+
+INT_TYPES = frozenset(("int", "long", "short", "byte", "char", "unsigned", "signed", "size_t",
+    "uint8_t", "int8_t", "uint16_t", "int16_t", "uint32_t", "int32_t", "word"))
+FLOAT_TYPES = frozenset(("float", "double"))
+BOOL_TYPES = frozenset(("bool", "boolean"))
+TYPE_QUALIFIERS = frozenset(("static", "const", "volatile"))
+
+CONSTANTS = {
+    "true": 1,
+    "false": 0,
+    "HIGH": 1,
+    "LOW": 0,
+    "PI": math.pi,
+    "HALF_PI": 0.5 * math.pi,
+    "TWO_PI": 2.0 * math.pi,
+    "DEG_TO_RAD": math.pi / 180.0,
+    "RAD_TO_DEG": 180.0 / math.pi,
+}
+
+MATH_FUNCTIONS = {
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "atan2": math.atan2,
+    "sqrt": math.sqrt,
+    "pow": math.pow,
+    "abs": abs,
+    "fabs": math.fabs,
+    "min": min,
+    "max": max,
+    "floor": math.floor,
+    "ceil": math.ceil,
+    "fmod": lambda a, b: _c_remainder(float(a), float(b)),
+    "round": lambda x: float(math.floor(x + 0.5)),
+    "radians": math.radians,
+    "degrees": math.degrees,
+    "constrain": lambda x, low, high: min(max(x, low), high),
+}
+
+class SketchError(Exception):
+    pass
+
+class _Return(Exception):
+    def __init__(self, value):
+        self.value = value
+
+class _Break(Exception):
+    pass
+
+class _Continue(Exception):
+    pass
+
+_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<number>(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?[fFlLuU]*)
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')
+  | (?P<op>\+\+|--|->|<<=|>>=|\+=|-=|\*=|/=|%=|&=|\|=|\^=|==|!=|<=|>=|&&|\|\||<<|>>|[-+*/%<>=!&|^~?:;,.(){}\[\]])
+""", re.VERBOSE)
+
+def _strip(source):
+    source = re.sub(r"/\*.*?\*/", " ", source, flags=re.DOTALL)
+    source = re.sub(r"//[^\n]*", "", source)
+    return re.sub(r"^\s*#[^\n]*", "", source, flags=re.MULTILINE)
+
+def _tokenize(source):
+    tokens = []
+    position = 0
+    while position < len(source):
+        match = _TOKEN.match(source, position)
+        if match is None:
+            raise SketchError("unexpected character %r" % source[position])
+        position = match.end()
+        kind = match.lastgroup
+        if kind == "space":
+            continue
+        text = match.group()
+        if kind == "number":
+            digits = text.rstrip("fFlLuU")
+            if re.match(r"^\d+$", digits):
+                tokens.append(("number", int(digits)))
+            else:
+                tokens.append(("number", float(digits)))
+        else:
+            tokens.append((kind, text))
+    tokens.append(("end", None))
+    return tokens
+
+# binary operator precedence, higher binds tighter
+_PRECEDENCE = {
+    "||": 1, "&&": 2, "|": 3, "^": 4, "&": 5,
+    "==": 6, "!=": 6, "<": 7, ">": 7, "<=": 7, ">=": 7,
+    "<<": 8, ">>": 8, "+": 9, "-": 9, "*": 10, "/": 10, "%": 10,
+}
+_ASSIGNMENTS = frozenset(("=", "+=", "-=", "*=", "/=", "%=", "&=", "|=", "^=", "<<=", ">>="))
+
+class _Parser(object):
+    """
+    Recursive descent parser producing nested tuples:
+    statements ("block", [...]), ("decl", kind, [(name, expr)]), ("expr", e),
+    ("if", c, a, b), ("for", init, c, step, body), ("while", c, body),
+    ("do", body, c), ("return", e), ("break",), ("continue",), ("nop",) and
+    expressions ("num", v), ("var", n), ("call", n, [args]), ("unary", op, e),
+    ("binary", op, a, b), ("assign", op, n, e), ("step", op, prefix, n),
+    ("cond", c, a, b), ("cast", kind, e).
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self, offset=0):
+        return self.tokens[min(self.position + offset, len(self.tokens) - 1)]
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def accept(self, text):
+        if self.peek()[1] == text and self.peek()[0] in ("op", "name"):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, text):
+        if not self.accept(text):
+            raise SketchError("expected %r, found %r" % (text, self.peek()[1]))
+
+    def type_kind(self):
+        """
+        Consume a type name if one follows and return "int", "float" or
+        "bool" (or "void"), otherwise None.
+        """
+        start = self.position
+        kind = None
+        while self.peek()[0] == "name":
+            word = self.peek()[1]
+            if word in TYPE_QUALIFIERS:
+                pass
+            elif word in INT_TYPES:
+                kind = kind or "int"
+            elif word in FLOAT_TYPES:
+                kind = "float"
+            elif word in BOOL_TYPES:
+                kind = "bool"
+            elif word == "void":
+                kind = "void"
+            else:
+                break
+            self.position += 1
+        if kind is None:
+            self.position = start
+        return kind
+
+    def parameters(self):
+        """
+        Consume a parameter list after its "(". Returns [(kind, name), ...]
+        (name None in unnamed prototypes), or None when a parameter is not a
+        plain int/float/bool (objects, references, arrays).
+        """
+        parameters = []
+        if self.accept(")"):
+            return parameters
+        while True:
+            kind = self.type_kind()
+            if kind == "void" and self.accept(")"):
+                return parameters
+            if kind is None or kind == "void":
+                break
+            if self.peek() in (("op", "&"), ("op", "*")):
+                break
+            name = self.next()[1] if self.peek()[0] == "name" else None
+            if self.peek() == ("op", "["):
+                break
+            parameters.append((kind, name))
+            if self.accept(")"):
+                return parameters
+            if not self.accept(","):
+                break
+        self._skip_parameters()
+        return None
+
+    def _skip_parameters(self):
+        # skip to the ")" closing the parameter list
+        depth = 1
+        while True:
+            token = self.next()
+            if token[0] == "end" or token in (("op", "{"), ("op", "}"), ("op", ";")):
+                raise SketchError("unterminated parameter list")
+            if token == ("op", "("):
+                depth += 1
+            elif token == ("op", ")"):
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def block(self):
+        self.expect("{")
+        statements = []
+        while not self.accept("}"):
+            if self.peek()[0] == "end":
+                raise SketchError("unterminated block")
+            statements.append(self.statement())
+        return ("block", statements)
+
+    def declaration(self, kind):
+        names = []
+        while True:
+            while self.accept("*"):
+                pass
+            token = self.next()
+            if token[0] != "name":
+                raise SketchError("expected a variable name, found %r" % (token[1],))
+            value = self.expression() if self.accept("=") else None
+            names.append((token[1], value))
+            if not self.accept(","):
+                break
+        return ("decl", kind, names)
+
+    def statement(self):
+        token = self.peek()
+        if token == ("op", "{"):
+            return self.block()
+        if token == ("op", ";"):
+            self.next()
+            return ("nop",)
+        if token[0] == "name":
+            word = token[1]
+            if word == "if":
+                self.next()
+                self.expect("(")
+                condition = self.expression()
+                self.expect(")")
+                then = self.statement()
+                otherwise = self.statement() if self.accept("else") else ("nop",)
+                return ("if", condition, then, otherwise)
+            if word == "for":
+                self.next()
+                self.expect("(")
+                kind = self.type_kind()
+                if kind:
+                    init = self.declaration(kind)
+                elif self.peek() != ("op", ";"):
+                    init = ("expr", self.expression())
+                else:
+                    init = ("nop",)
+                self.expect(";")
+                condition = self.expression() if self.peek() != ("op", ";") else ("num", 1)
+                self.expect(";")
+                step = self.expression() if self.peek() != ("op", ")") else ("num", 0)
+                self.expect(")")
+                return ("for", init, condition, step, self.statement())
+            if word == "while":
+                self.next()
+                self.expect("(")
+                condition = self.expression()
+                self.expect(")")
+                return ("while", condition, self.statement())
+            if word == "do":
+                self.next()
+                body = self.statement()
+                self.expect("while")
+                self.expect("(")
+                condition = self.expression()
+                self.expect(")")
+                self.expect(";")
+                return ("do", body, condition)
+            if word == "return":
+                self.next()
+                value = None if self.peek() == ("op", ";") else self.expression()
+                self.expect(";")
+                return ("return", value)
+            if word in ("break", "continue"):
+                self.next()
+                self.expect(";")
+                return (word,)
+            kind = self.type_kind()
+            if kind:
+                statement = self.declaration(kind)
+                self.expect(";")
+                return statement
+        statement = ("expr", self.expression())
+        self.expect(";")
+        return statement
+
+    def expression(self):
+        return self.assignment()
+
+    def assignment(self):
+        token, following = self.peek(), self.peek(1)
+        if token[0] == "name" and following[0] == "op" and following[1] in _ASSIGNMENTS:
+            self.position += 2
+            return ("assign", following[1], token[1], self.assignment())
+        return self.conditional()
+
+    def conditional(self):
+        condition = self.binary(1)
+        if self.accept("?"):
+            then = self.expression()
+            self.expect(":")
+            return ("cond", condition, then, self.conditional())
+        return condition
+
+    def binary(self, precedence):
+        left = self.unary()
+        while True:
+            token = self.peek()
+            level = _PRECEDENCE.get(token[1]) if token[0] == "op" else None
+            if level is None or level < precedence:
+                return left
+            self.next()
+            left = ("binary", token[1], left, self.binary(level + 1))
+
+    def unary(self):
+        token = self.peek()
+        if token[0] == "op" and token[1] in ("-", "+", "!", "~"):
+            self.next()
+            return ("unary", token[1], self.unary())
+        if token[0] == "op" and token[1] in ("++", "--"):
+            self.next()
+            name = self.next()
+            return ("step", token[1], True, name[1])
+        if token == ("op", "("):
+            # cast, e.g. (int)x
+            self.next()
+            kind = self.type_kind()
+            if kind:
+                self.expect(")")
+                return ("cast", kind, self.unary())
+            value = self.expression()
+            self.expect(")")
+            return self.postfix(value)
+        return self.postfix(self.primary())
+
+    def postfix(self, value):
+        token = self.peek()
+        if value[0] == "var" and token[0] == "op" and token[1] in ("++", "--"):
+            self.next()
+            return ("step", token[1], False, value[1])
+        return value
+
+    def primary(self):
+        token = self.next()
+        if token[0] == "number":
+            return ("num", token[1])
+        if token[0] == "name":
+            if self.accept("("):
+                arguments = []
+                if not self.accept(")"):
+                    while True:
+                        arguments.append(self.expression())
+                        if self.accept(")"):
+                            break
+                        self.expect(",")
+                return ("call", token[1], arguments)
+            return ("var", token[1])
+        raise SketchError("unexpected %r" % (token[1],))
+
+def _convert(kind, value):
+    if kind == "int":
+        if isinstance(value, float) and (math.isinf(value) or math.isnan(value)):
+            raise SketchError("cannot convert %r to an integer" % value)
+        return int(value)
+    if kind == "float":
+        return float(value)
+    if kind == "bool":
+        return 1 if value else 0
+    return value
+
+def _c_divide(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        if b == 0:
+            raise SketchError("integer division by zero")
+        quotient = abs(a) // abs(b)
+        return quotient if (a >= 0) == (b >= 0) else -quotient
+    if b == 0:
+        # IEEE 754, as on the Arduino: +-inf, or nan for 0 / 0
+        if a == 0 or math.isnan(a):
+            return float("nan")
+        return math.copysign(float("inf"), a) * math.copysign(1.0, b)
+    return a / float(b)
+
+def _c_remainder(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        return a - b * _c_divide(a, b)
+    if b == 0 or math.isinf(a) or math.isnan(b):
+        return float("nan")
+    return math.fmod(a, b)
+
+def _math(function, args):
+    # C math functions return nan on domain errors and inf on overflow
+    try:
+        return function(*args)
+    except ValueError:
+        return float("nan")
+    except OverflowError:
+        return float("inf")
+    except TypeError:
+        raise SketchError("wrong number of arguments")
+
+_ARITHMETIC = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": _c_divide,
+    "%": _c_remainder,
+    "<": lambda a, b: int(a < b),
+    ">": lambda a, b: int(a > b),
+    "<=": lambda a, b: int(a <= b),
+    ">=": lambda a, b: int(a >= b),
+    "==": lambda a, b: int(a == b),
+    "!=": lambda a, b: int(a != b),
+    "&": lambda a, b: int(a) & int(b),
+    "|": lambda a, b: int(a) | int(b),
+    "^": lambda a, b: int(a) ^ int(b),
+    "<<": lambda a, b: int(a) << int(b),
+    ">>": lambda a, b: int(a) >> int(b),
+}
+
+class Sketch(object):
+    """
+    A parsed Arduino sketch. run() executes one of its functions and returns
+    the drawing API calls it made as a list of Commands.
+    """
+
+    def __init__(self, source):
+        self.functions = {}
+        self.globals = {}
+        self._tokens = _tokenize(_strip(source))
+        parser = _Parser(self._tokens)
+        while parser.peek()[0] != "end":
+            self._top_level(parser)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(f.read())
+
+    def _top_level(self, parser):
+        start = parser.position
+        kind = parser.type_kind()
+        token, following = parser.peek(), parser.peek(1)
+        if kind and token[0] == "name" and following == ("op", "("):
+            # function definition (or prototype)
+            parser.position += 2
+            # None for parameters the interpreter cannot pass, such functions
+            # fail when called
+            parameters = parser.parameters()
+            if parser.accept(";"):
+                return
+            # bodies are only parsed when called: the hardware functions use
+            # C++ (method calls on the motor objects) that is not understood
+            body_start = parser.position
+            self._skip(parser)
+            self.functions[token[1]] = (kind, parameters, (body_start, parser.position))
+            return
+        if kind and kind != "void":
+            try:
+                declaration = parser.declaration(kind)
+                parser.expect(";")
+                self._declare(self.globals, declaration[1], declaration[2])
+                return
+            except (SketchError, KeyError):
+                pass
+        # anything else at the top level (objects, includes) is skipped
+        parser.position = start
+        self._skip(parser)
+
+    def _skip(self, parser):
+        # skip a statement or a brace delimited block
+        depth = 0
+        while True:
+            token = parser.next()
+            if token[0] == "end":
+                return
+            if token == ("op", "{"):
+                depth += 1
+            elif token == ("op", "}"):
+                depth -= 1
+                if depth <= 0:
+                    parser.accept(";")
+                    return
+            elif token == ("op", ";") and depth == 0:
+                return
+
+    def run(self, function="drawPicture"):
+        if function not in self.functions:
+            raise SketchError("the sketch has no function %s()" % function)
+        self._commands = []
+        self._steps = 0
+        self._depth = 0
+        try:
+            self._call(function, [])
+        except RuntimeError:
+            # python's own recursion limit, should MAX_CALL_DEPTH not be hit first
+            raise SketchError("the program recursed too deeply")
+        return self._commands
+
+    # execution
+
+    def _emit(self, name, *args):
+        if len(self._commands) >= MAX_COMMANDS:
+            raise SketchError("more than %d drawing commands" % MAX_COMMANDS)
+        self._commands.append(Command(name, args))
+
+    def _builtin(self, name, args):
+        if name == "driveForward":
+            self._emit("drive", _convert("int", args[0]), max(0, _convert("int", args[1])))
+        elif name == "turnLeft":
+            self._emit("left", max(0, _convert("int", args[0])))
+        elif name == "turnRight":
+            self._emit("right", max(0, _convert("int", args[0])))
+        elif name == "penDown":
+            self._emit("pen", True)
+        elif name == "penUp":
+            self._emit("pen", False)
+        elif name in ("wait", "delay"):
+            self._emit("wait", max(0, _convert("int", args[0])))
+        elif name in MATH_FUNCTIONS:
+            try:
+                return _math(MATH_FUNCTIONS[name], args)
+            except SketchError as e:
+                raise SketchError("%s(): %s" % (name, e))
+        else:
+            raise SketchError("unsupported function %s()" % name)
+
+    def _call(self, name, args):
+        if name in ("driveForward", "turnLeft", "turnRight", "penDown", "penUp", "wait", "delay") \
+                or name not in self.functions:
+            return self._builtin(name, args)
+        kind, parameters, body = self.functions[name]
+        if parameters is None:
+            raise SketchError("%s() takes parameters that are not int, float or bool" % name)
+        if not isinstance(body[0], str):
+            body = _Parser(self._tokens[body[0]:body[1]] + [("end", None)]).block()
+            self.functions[name] = (kind, parameters, body)
+        if len(parameters) != len(args):
+            raise SketchError("%s() takes %d arguments" % (name, len(parameters)))
+        scope = dict(
+            (parameter, [parameter_kind, _convert(parameter_kind, value)])
+            for ((parameter_kind, parameter), value) in zip(parameters, args)
+        )
+        if self._depth >= MAX_CALL_DEPTH:
+            raise SketchError("more than %d nested function calls" % MAX_CALL_DEPTH)
+        self._depth += 1
+        try:
+            self._execute(body, [self.globals, scope])
+        except _Return as result:
+            return None if kind == "void" or result.value is None else _convert(kind, result.value)
+        finally:
+            self._depth -= 1
+        return None
+
+    def _declare(self, scope, kind, names, scopes=None):
+        for (name, value) in names:
+            value = 0 if value is None else self._evaluate(value, scopes or [self.globals])
+            scope[name] = [kind, _convert(kind, value)]
+
+    def _lookup(self, name, scopes):
+        for scope in reversed(scopes):
+            if name in scope:
+                return scope[name]
+        raise SketchError("unknown variable %s" % name)
+
+    def _execute(self, statement, scopes):
+        self._steps += 1
+        if self._steps > MAX_STEPS:
+            raise SketchError("the program ran for more than %d steps" % MAX_STEPS)
+        kind = statement[0]
+        if kind == "block":
+            inner = scopes + [{}]
+            for child in statement[1]:
+                self._execute(child, inner)
+        elif kind == "expr":
+            self._evaluate(statement[1], scopes)
+        elif kind == "decl":
+            self._declare(scopes[-1], statement[1], statement[2], scopes)
+        elif kind == "if":
+            if self._evaluate(statement[1], scopes):
+                self._execute(statement[2], scopes)
+            else:
+                self._execute(statement[3], scopes)
+        elif kind == "for":
+            inner = scopes + [{}]
+            self._execute(statement[1], inner)
+            while self._evaluate(statement[2], inner):
+                try:
+                    self._execute(statement[4], inner)
+                except _Break:
+                    break
+                except _Continue:
+                    pass
+                self._evaluate(statement[3], inner)
+                self._steps += 1
+        elif kind in ("while", "do"):
+            condition, body = (statement[1], statement[2]) if kind == "while" else (statement[2], statement[1])
+            while kind == "do" or self._evaluate(condition, scopes):
+                try:
+                    self._execute(body, scopes)
+                except _Break:
+                    break
+                except _Continue:
+                    pass
+                self._steps += 1
+                if kind == "do" and not self._evaluate(condition, scopes):
+                    break
+        elif kind == "return":
+            raise _Return(None if statement[1] is None else self._evaluate(statement[1], scopes))
+        elif kind == "break":
+            raise _Break()
+        elif kind == "continue":
+            raise _Continue()
+
+    def _evaluate(self, expression, scopes):
+        kind = expression[0]
+        if kind == "num":
+            return expression[1]
+        if kind == "var":
+            name = expression[1]
+            for scope in reversed(scopes):
+                if name in scope:
+                    return scope[name][1]
+            if name in CONSTANTS:
+                return CONSTANTS[name]
+            raise SketchError("unknown variable %s" % name)
+        if kind == "binary":
+            op = expression[1]
+            if op == "&&":
+                return int(bool(self._evaluate(expression[2], scopes)) and bool(self._evaluate(expression[3], scopes)))
+            if op == "||":
+                return int(bool(self._evaluate(expression[2], scopes)) or bool(self._evaluate(expression[3], scopes)))
+            return _ARITHMETIC[op](self._evaluate(expression[2], scopes), self._evaluate(expression[3], scopes))
+        if kind == "unary":
+            value = self._evaluate(expression[2], scopes)
+            if expression[1] == "-":
+                return -value
+            if expression[1] == "!":
+                return int(not value)
+            if expression[1] == "~":
+                return ~int(value)
+            return value
+        if kind == "call":
+            return self._call(expression[1], [self._evaluate(a, scopes) for a in expression[2]])
+        if kind == "assign":
+            variable = self._lookup(expression[2], scopes)
+            value = self._evaluate(expression[3], scopes)
+            if expression[1] != "=":
+                value = _ARITHMETIC[expression[1][:-1]](variable[1], value)
+            variable[1] = _convert(variable[0], value)
+            return variable[1]
+        if kind == "step":
+            variable = self._lookup(expression[3], scopes)
+            previous = variable[1]
+            variable[1] = _convert(variable[0], previous + (1 if expression[1] == "++" else -1))
+            return variable[1] if expression[2] else previous
+        if kind == "cond":
+            if self._evaluate(expression[1], scopes):
+                return self._evaluate(expression[2], scopes)
+            return self._evaluate(expression[3], scopes)
+        if kind == "cast":
+            return _convert(expression[1], self._evaluate(expression[2], scopes))
+        raise SketchError("cannot evaluate %r" % (kind,))